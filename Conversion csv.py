@@ -1,46 +1,137 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
-import re
+from ingestion import parse_price, parse_room_size_type, parse_street_zip
+
+# Converts raw scraper exports (.xlsx or .csv) into the ;-separated city csv files the trainer reads
+# Every workbook is read row by row in read-only mode and converted in chunks, so even a national export is never
+# fully in memory. Several files (cities) are converted at the same time, one per core.
+#
+#   python "Conversion csv.py" "exports/*.xlsx" --out-dir .
+
+# columns of the scraper export
+ROOM_SIZE_TYPE = 'textLoadingClassname 2'
+STREET_ZIP = 'textLoadingClassname 3'
+RENT = 'textLoadingClassname 4'
+PRICE_M2_YEAR = 'textLoadingClassname 5'
+CHARACTERISTICS = ['css-8uhtka', 'css-8uhtka 2', 'css-8uhtka 3']
+
+# same columns and order as zurich.csv
+OUTPUT_COLUMNS = ['number_of_rooms', 'square_meters', 'place_type', 'street', 'zip_city', 'char.1', 'char.2', 'char.3', 'rent', 'p/squarem/y']
+
+
+# cleans one chunk of the export, rows without ZIP code/city or rent can't be used and are skipped
+def convert_chunk(df):
+    clean_df = pd.DataFrame(index=df.index)
+
+    # Extract number_of_rooms, square_meters, place_type
+    room_size_type = parse_room_size_type(df[ROOM_SIZE_TYPE].astype('string'))
+    clean_df['number_of_rooms'] = pd.to_numeric(room_size_type[0], errors='coerce')
+    clean_df['square_meters'] = pd.to_numeric(room_size_type[1], errors='coerce')
+    clean_df['place_type'] = room_size_type[2]
+
+    # Extract street and zip_city
+    street_zip = parse_street_zip(df[STREET_ZIP].astype('string'))
+    clean_df['street'] = street_zip[0]
+    clean_df['zip_city'] = street_zip[1]
+
+    # Copy characteristics
+    for i, column in enumerate(CHARACTERISTICS, start=1):
+        clean_df[f'char.{i}'] = df[column]
+
+    # Extract rent and price per m2/year
+    clean_df['rent'] = parse_price(df[RENT])
+    clean_df['p/squarem/y'] = df[PRICE_M2_YEAR].astype('string').str.replace(r'\s+', ' ', regex=True)
+
+    usable = clean_df['zip_city'].notna() & clean_df['rent'].notna()
+    return clean_df.loc[usable, OUTPUT_COLUMNS], int((~usable).sum())
+
 
-# define input and output of the program
-input_file = "zurich.xlsx"   # Change this to the city you want to process, can be the raw .xlsx file
-output_file = "zurich_cleaned.csv"  # Change to what the output should be (needs to be csv file)
+# chunks of the export as DataFrames, xlsx files are streamed with openpyxl instead of loaded at once
+def read_chunks(input_file, chunksize):
+    if input_file.lower().endswith(".csv"):
+        yield from pd.read_csv(input_file, chunksize=chunksize, dtype=str)
+        return
 
-# Read file
-df = pd.read_excel(input_file)
+    from openpyxl import load_workbook
+    workbook = load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h) if h is not None else "" for h in next(rows, [])]
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
 
-# Prepare cleaned dataframe
-clean_df = pd.DataFrame()
 
-# Extract number_of_rooms, square_meters, place_type 
-room_size_type = df['textLoadingClassname 2'].str.extract(r'(?:(\d+(?:\.\d+)?)\s*rooms?)?\s*•?\s*(\d+)\s*m²\s*•?\s*(.*)')
+def output_name(input_file, out_dir):
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(out_dir, f"{name}_cleaned.csv")
 
-clean_df['number_of_rooms'] = room_size_type[0]
-clean_df['square_meters'] = room_size_type[1]
-clean_df['place_type'] = room_size_type[2]
 
-# Extract street and zip_city 
-street_zip = df['textLoadingClassname 3'].str.extract(r'^(.*),\s*(\d{4}\s+\w+.*)$')
+# converts one export, returns (input, output, converted rows, skipped rows, seconds)
+def convert_file(input_file, output_file, chunksize=5000):
+    start = time.perf_counter()
+    rows = skipped = 0
+    header = True
+    for chunk in read_chunks(input_file, chunksize):
+        clean_df, not_usable = convert_chunk(chunk)
+        # same format as the city files: ; separated and latin1
+        clean_df.to_csv(output_file, sep=";", index=False, mode="w" if header else "a", header=header,
+                        encoding="latin1", errors="replace")
+        header = False
+        rows += len(clean_df)
+        skipped += not_usable
+    if header: # empty export, still write the header
+        pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(output_file, sep=";", index=False, encoding="latin1")
+    return input_file, output_file, rows, skipped, time.perf_counter() - start
 
-clean_df['street'] = street_zip[0]
-clean_df['zip_city'] = street_zip[1]
 
-# Copy characteristics 
-clean_df['char.1'] = df['css-8uhtka']
-clean_df['char.2'] = df['css-8uhtka 2']
-clean_df['char.3'] = df['css-8uhtka 3']
+def report(result):
+    input_file, output_file, rows, skipped, seconds = result
+    print(f"{input_file} -> {output_file}: {rows:,} rows, {skipped:,} skipped, "
+          f"{(rows + skipped) / max(seconds, 1e-9):,.0f} rows/s")
 
-# Extract rent 
-clean_df['rent'] = df['textLoadingClassname 4'].str.replace(r'[^\d.]', '', regex=True)
 
-# Extract price per m2/year 
-clean_df['p/squarem/y'] = df['textLoadingClassname 5'].str.replace(r'\s+', ' ', regex=True)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert raw scraper exports into ;-separated city csv files.")
+    parser.add_argument("inputs", nargs="+", help="export files or glob patterns, e.g. 'exports/*.xlsx'")
+    parser.add_argument("--out-dir", default=".", help="folder of the converted files, named <input>_cleaned.csv (default: .)")
+    parser.add_argument("--chunksize", type=int, default=5000, help="rows converted at once (default: 5000)")
+    parser.add_argument("--workers", type=int, default=None, help="files converted in parallel (default: number of cores)")
+    args = parser.parse_args()
 
-# Convert datatypes
-clean_df['number_of_rooms'] = pd.to_numeric(clean_df['number_of_rooms'], errors='coerce')
-clean_df['square_meters'] = pd.to_numeric(clean_df['square_meters'], errors='coerce')
-clean_df['rent'] = pd.to_numeric(clean_df['rent'], errors='coerce')
+    input_files = sorted({f for pattern in args.inputs for f in (glob.glob(pattern) or [pattern]) if os.path.isfile(f)})
+    if not input_files:
+        parser.error("no input files found")
+    os.makedirs(args.out_dir, exist_ok=True)
+    workers = min(args.workers or os.cpu_count() or 1, len(input_files))
 
-# Save cleaned CSV
-clean_df.to_csv(output_file, index=False)
+    start = time.perf_counter()
+    results = []
+    if workers == 1:
+        for f in input_files:
+            results.append(convert_file(f, output_name(f, args.out_dir), args.chunksize))
+            report(results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(convert_file, f, output_name(f, args.out_dir), args.chunksize) for f in input_files]
+            for future in futures:
+                results.append(future.result())
+                report(results[-1])
 
-print(f"Cleaned data saved to {output_file}")
+    seconds = time.perf_counter() - start
+    rows = sum(r[2] for r in results)
+    skipped = sum(r[3] for r in results)
+    print(f"Converted {len(results)} files: {rows:,} rows, {skipped:,} skipped, "
+          f"{(rows + skipped) / max(seconds, 1e-9):,.0f} rows/s in {seconds:.1f} s")
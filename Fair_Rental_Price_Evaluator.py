@@ -1,17 +1,9 @@
 import streamlit as st
-import requests
-import folium
-from streamlit_folium import st_folium
-import joblib
-import pandas as pd
-import numpy as np
-import os
-import matplotlib.pyplot as plt # For Diagrams
 import math
-from geopy.geocoders import Nominatim # For Amenities
-from geopy.distance import geodesic 
-import streamlit.components.v1 as components
-import time # helps to prevent API crashes 
+import os
+
+# Only streamlit is imported for every page. The model, plotting, mapping and data modules are imported where they
+# are used, so the welcome and input pages render without loading them (see benchmarks/bench_startup.py)
 
 #Variables that always exist and prevent crashes when reloading the page at the wrong time
 if "page" not in st.session_state:
@@ -36,89 +28,113 @@ if "amenities" not in st.session_state:
     st.session_state.amenities = []
 if "radius" not in st.session_state:
     st.session_state.radius = 300
+if "session_id" not in st.session_state:
+    st.session_state.session_id = os.urandom(4).hex() # groups the logged render timings of one visitor
 
 st.set_page_config(page_title="Fair Rental Price Evaluator", layout="wide")
 
 # Load model (price estimator)
-@st.cache_resource
-def load_model():
+# the compact, memory-mapped model is used when it was exported with "train_model_all_cities.py --compact"
+# model_version is the signature of the diagnostics file, which the trainer writes on every training: the model,
+# the shards, the diagnostics and the comparables below are all loaded again after a retrain, only the latest is kept
+@st.cache_resource(max_entries=1)
+def load_model(model_version):
+    from compact_forest import CompactForest
+    if CompactForest.exists():
+        return CompactForest()
+    import joblib
     return joblib.load("price_estimator.pkl")
 
-model_pipeline = load_model()
-
-@st.cache_data
-# gets apartment location and map from openstreetmap
+# Models per ZIP region (see model_router.py), only used when they were trained with "--shards"
+# the unified model is the fallback and is only loaded when a ZIP code without a shard is estimated
+@st.cache_resource(max_entries=1)
+def load_model_router(model_version):
+    from model_router import ModelRouter
+    if ModelRouter.exists():
+        return ModelRouter(lambda: load_model(model_version))
+    return None
+
+# Load diagnostics once per model version, the predictions of the test set are precomputed by the trainer
+@st.cache_resource(max_entries=1)
+def load_model_diagnostics(model_version):
+    from diagnostics import load_diagnostics
+    return load_diagnostics(load_model(model_version))
+
+# Background of the predicted vs. actual diagram, rendered once per model version (see charts.py)
+@st.cache_resource(max_entries=1)
+def load_scatter_background(model_version):
+    from charts import ScatterBackground
+    diagnostics = load_model_diagnostics(model_version)
+    scatter = diagnostics["scatter"]
+    return ScatterBackground(scatter["actual"], scatter["predicted"], diagnostics["actual_range"])
+
+# png of the market price diagram, an apartment that was already shown isn't drawn again
+@st.cache_data(max_entries=256)
+def market_bar_chart(user_value, median, p25, p75, zip_code):
+    from charts import market_bar_png
+    return market_bar_png(user_value, median, p25, p75, zip_code)
+
+# Index of the most similar training listings, built by the trainer (see comparables.py)
+@st.cache_resource(max_entries=1)
+def load_comparables_index(model_version):
+    from comparables import COMPARABLES_FILE, load_comparables
+    if os.path.exists(COMPARABLES_FILE):
+        return load_comparables()
+    return None
+
+# gets apartment location from openstreetmap
+# known addresses come from the shared geocoding cache, new ones are rate limited (see geocoding.py)
 def get_location(address, zip_code, city, country='CH'):
-    query = f"{address}, {zip_code} {city}, {country}"
-    url = f"https://nominatim.openstreetmap.org/search?q={query}&format=json"
-    
-    time.sleep(1)  # pause 1 sec to prevent crashes and too many requests
-    
-    response = requests.get(url, headers={'User-Agent': 'streamlit_app (cedric.frutiger@startglobal.org)'}) # user-agent to prevent api crashes
-    if response.status_code != 200:
+    from geocoding import get_geocoder
+    location = get_geocoder().geocode(f"{address}, {zip_code} {city}, {country}")
+    if location is None:
         return None, None
-    data = response.json()
-    if data:
-        return float(data[0]['lat']), float(data[0]['lon'])
-    return None, None
-
-# gets amenities and there location from overpass
-def get_amenity_elements(amenity, lat, lon, radius):
-    key = f"amenity_data_{amenity.lower()}"
-    if key in st.session_state:
-        return st.session_state[key]
-
-    # changes of user tags to actual osm tags
-    tag_mapping = {
-        "supermarket": ("shop", "supermarket"),
-        "school": ("amenity", "school"),
-        "hospital": ("amenity", "hospital"),
-        "pharmacy": ("amenity", "pharmacy"),
-        "restaurant": ("amenity", "restaurant")
-    }
-    # fallback for not found amenities
-    tag_key, tag_value = tag_mapping.get(amenity.lower(), ("amenity", amenity.lower()))
-
-    query = f"""
-    [out:json];
-    (
-      node["{tag_key}"="{tag_value}"](around:{radius},{lat},{lon});
-      way["{tag_key}"="{tag_value}"](around:{radius},{lat},{lon});
-      relation["{tag_key}"="{tag_value}"](around:{radius},{lat},{lon});
-    );
-    out center;
-    """
-
-    try:
-        response = requests.post("https://overpass-api.de/api/interpreter", data=query, timeout=30)
-        response.raise_for_status()
-        elements = response.json().get("elements", [])
-        st.session_state[key] = elements
-        return elements
-    except Exception as e:
-        st.error(f"Failed to retrieve amenities for {amenity}: {e}")
-    return []
-
-# Get average price per m2 per year from training csv files
-city_files = {
-    "Geneva": "geneve.csv",
-    "Lausanne": "lausanne.csv",
-    "Zurich": "zurich.csv",
-    "St. Gallen": "st.gallen.csv"
-}
-
-zip_avg_p_sqm_y = {}
-for city, filename in city_files.items():
-    if os.path.exists(filename):
-        df = pd.read_csv(filename, encoding="latin1", sep=";")
-        df[['ZIP', 'City']] = df['zip_city'].str.extract(r'(\d{4})\s*(.*)')
-        df['ZIP'] = pd.to_numeric(df['ZIP'], errors='coerce')
-        df['p/squarem/y'] = df['p/squarem/y'].astype(str).str.replace(r"[^\d.]", "", regex=True) # only takes numereical value from p/squarem/y
-        df['p/squarem/y'] = pd.to_numeric(df['p/squarem/y'], errors='coerce')# prevents "No market price data available for this city." output
-        
-        grouped = df.dropna(subset=['ZIP', 'p/squarem/y']).groupby('ZIP')['p/squarem/y'].mean()
-        for zip_code, avg_price in grouped.items():
-            zip_avg_p_sqm_y[int(zip_code)] = round(avg_price, 2)
+    return location.latitude, location.longitude
+
+# Offline amenity index (see amenity_index.py), only used when the index folder exists
+@st.cache_resource
+def load_amenity_index():
+    from amenity_index import AmenityIndex
+    if AmenityIndex.exists():
+        return AmenityIndex()
+    return None
+
+# Amenity searches are shared by all sessions of this process (see amenity_cache.py)
+@st.cache_resource
+def get_amenity_cache():
+    from amenity_cache import AmenityCache
+    return AmenityCache()
+
+# Thread pool for the location and amenity requests of the result page, shared by all sessions (see nearby_lookup.py)
+@st.cache_resource
+def get_lookup_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    from http_client import POOL_SIZE
+    return ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="nearby")
+
+# gets amenities and there location from the offline index or from overpass
+# returns the function that runs in the thread pool, the cached resources are looked up here because
+# streamlit functions must not be called from the threads, new cache entries count against the budget of the session
+def amenity_fetcher(session=None):
+    amenity_index = load_amenity_index()
+    if amenity_index is not None:
+        def fetch(amenity, lat, lon, radius, timeout):
+            return amenity_index.elements(amenity, lat, lon, radius) # no network request needed
+        return fetch
+
+    from functools import partial
+    from overpass import query_overpass
+    amenity_cache = get_amenity_cache()
+    def fetch(amenity, lat, lon, radius, timeout):
+        return amenity_cache.get(amenity.lower(), lat, lon, radius, partial(query_overpass, timeout=timeout), session)
+    return fetch
+
+# Get the median and percentiles of the price per m2 per year per ZIP code from the training csv files
+# the index is only updated when one of the csv files changed or new listings were added (see market_stats.py)
+@st.cache_resource
+def load_market_prices(signatures):
+    from market_stats import load_market_stats
+    return load_market_stats()
 
 # Checks for a session state (avoids reruns and errors when displaxint the results)
 # If nothing is found go to welcome page
@@ -199,6 +215,37 @@ if st.session_state.page == "input":
 
 # RESULT PAGE
 if st.session_state.page == "result":
+    # timing of every stage of this render, shown in the debug panel and logged (see perf.py)
+    from perf import RenderTrace
+    trace = RenderTrace("result", st.session_state.session_id)
+
+    # modules only the result page needs
+    with trace.span("imports"):
+        import folium
+        from streamlit_folium import st_folium
+        from distances import nearest_elements
+        from features import apartment_features
+        from geocoding import get_geocoder
+        from diagnostics import DIAGNOSTICS_FILE
+        from ingestion import file_signature
+
+    trace.track_cache("geocoder", get_geocoder().stats)
+    trace.track_cache("amenities", get_amenity_cache().stats)
+
+    # the address and the amenities are requested in the background while the price is estimated
+    from functools import partial
+    from nearby_lookup import NearbyLookup
+    lookup = NearbyLookup(get_lookup_executor(),
+                          partial(get_location, st.session_state.address, st.session_state.zip_code, st.session_state.city),
+                          amenity_fetcher(st.session_state.session_id), st.session_state.amenities, st.session_state.radius)
+
+    model_version = tuple(file_signature(DIAGNOSTICS_FILE).values())
+    with trace.span("load_model"):
+        model_router = load_model_router(model_version)
+        if model_router is not None:
+            model_pipeline, model_name, calibration = model_router.model_for(st.session_state.zip_code)
+        else:
+            model_pipeline, model_name, calibration = load_model(model_version), "unified", None
 
     st.title("Fair Estimated Rent")
 
@@ -217,58 +264,53 @@ if st.session_state.page == "result":
         st.session_state.page = "input"
         st.rerun()
 
-    # Market price calculation with average price per m2 per year comparison
+    # Market price comparison with the median price per m2 per year of the ZIP code
+    # the signatures are part of the cache key, so a changed csv or added listings are picked up without restarting the app
+    with trace.span("market_prices"):
+        from market_stats import STATS_FILE, source_signatures
+        zip_market_prices = load_market_prices(source_signatures() + source_signatures([STATS_FILE]))
     user_zip = int(st.session_state.zip_code)
-    market_price_m2_y = zip_avg_p_sqm_y.get(user_zip)
-
-    # analyse inputs from input page and prep for estimation
-    outdoor_flag = 0 if st.session_state.outdoor_space == "No" else 1
-    renovated_flag = 1 if st.session_state.is_renovated == "Yes" else 0
-    parking_flag = 0
-    if st.session_state.parking == "Parking Outdoor":
-            parking_flag = 1
-    elif st.session_state.parking == "Garage":
-            parking_flag = 2
-    
-    # defins features for estimation and diagrams
-    features = pd.DataFrame([{
-        "ZIP": float(st.session_state.zip_code) if st.session_state.zip_code else 0.0,
-        "number_of_rooms": st.session_state.rooms,
-        "square_meters": st.session_state.size,
-        "place_type": "Apartment",
-        "Is_Renovated_or_New": renovated_flag,
-        "Has_Parking": parking_flag,
-        "Has_Outdoor_Space": outdoor_flag
-        }])
-
-    estimated_price = model_pipeline.predict(features)[0]
+    market = zip_market_prices.get(user_zip)
+
+    # defins features for estimation and diagrams (same preparation as batch_score.py)
+    features = apartment_features(st.session_state.zip_code, st.session_state.rooms, st.session_state.size,
+                                  st.session_state.outdoor_space, st.session_state.is_renovated, st.session_state.parking)
+
+    # Calibration of the price range on the test listings, shards and the compact model have their own (see intervals.py)
+    with trace.span("load_diagnostics"):
+        diagnostics = load_model_diagnostics(model_version)
+    calibration = calibration or getattr(model_pipeline, "calibration", None) or diagnostics["intervals"]
+
+    # estimate and price range from all trees in one pass, as fast as predict
+    with trace.span("predict"):
+        from intervals import DEFAULT_LEVEL, predict_interval
+        estimate, lower, upper = predict_interval(model_pipeline, features, calibration, DEFAULT_LEVEL)
+        estimated_price = estimate[0]
     st.session_state.estimated_price = estimated_price # Saves the estimated price
 
     col1, col2 = st.columns(2)
 
     with col1: # left side display below the Map
-        if market_price_m2_y is not None and not math.isnan(market_price_m2_y):
+        if market is not None and not math.isnan(market["median"]):
 
-            market_estimated_price = (market_price_m2_y / 12) * st.session_state.size
+            market_price_m2_y = market["median"] # the median isn't pulled up by a few luxury apartments like the mean
 
             st.subheader("Price per m² per Year Comparison")
 
             user_m2_price_year = (estimated_price / st.session_state.size) * 12
 
-            labels = ['Your Apartment', 'Market Average in your City']
-            values = [user_m2_price_year, market_price_m2_y]
-
-            fig, ax = plt.subplots(figsize=(8, 6))
-            bars = ax.bar(labels, values, color=["green", "blue"])
-            ax.set_ylabel("CHF per m² per year")
-            ax.set_title(f"Price per m²/year Comparison (ZIP {user_zip})")
+            with trace.span("bar_chart"):
+                st.image(market_bar_chart(round(user_m2_price_year, 2), market_price_m2_y, market["p25"], market["p75"], user_zip),
+                         use_column_width=True)
 
-            # Add value labels on bars
-            for bar in bars:
-                    height = bar.get_height()
-                    ax.text(bar.get_x() + bar.get_width() / 2, height + 5, f"{int(height)} CHF", ha='center', va='bottom')
-
-            st.pyplot(fig)
+            if user_m2_price_year < market["p25"]:
+                position = "cheaper than three quarters of them"
+            elif user_m2_price_year > market["p75"]:
+                position = "more expensive than three quarters of them"
+            else:
+                position = "within this range"
+            st.caption(f"Half of the {market['count']} listings in ZIP {user_zip} cost between CHF {market['p25']:,.0f} and "
+                       f"CHF {market['p75']:,.0f} per m² per year, the estimate for your apartment is {position}.")
 
         # Happens when city is not in the training data
         else:
@@ -278,45 +320,65 @@ if st.session_state.page == "result":
         
         st.subheader("Your Rent Compared to our Prediction")
 
-        # Load diagnostics
-        X_test, y_test, _ = joblib.load("model_diagnostics.pkl")
-        y_pred = model_pipeline.predict(X_test)
-
         # Add user's data point
         if "demanded_rent" in st.session_state and st.session_state.demanded_rent > 0:
             actual = st.session_state.demanded_rent
             predicted = st.session_state.estimated_price
 
-            # Plot
-            import matplotlib.pyplot as plt
-
-            plt.figure(figsize=(8, 6))
-            plt.scatter(y_test, y_pred, alpha=0.6, label='Training Data Predictions')
-            plt.plot([min(y_test), max(y_test)], [min(y_test), max(y_test)], 'r--', label='Ideal Prediction Line')
+            # Plot, only the user point is drawn onto the cached diagram of the test listings
+            with trace.span("scatter_chart"):
+                background = load_scatter_background(model_version)
+                st.image(background.with_point(actual, predicted), use_column_width=True)
 
-            # Add user point
-            plt.scatter(actual, predicted, color='red', s=100, label='Entered Apartment')
-            plt.xlabel("Actual Rent (CHF)")
-            plt.ylabel("Predicted Rent (CHF)")
-            plt.title("Predicted vs. Actual Rent Price")
-            plt.legend()
-            st.pyplot(plt)
-
-    lower_bound = int(estimated_price * 0.9)
-    upper_bound = int(estimated_price * 1.1)
+    lower_bound = int(lower[0])
+    upper_bound = int(upper[0])
 
     st.subheader("Comparable Price Range")
     st.write(f"CHF {lower_bound:,} - CHF {upper_bound:,}")
     st.write(f"Comparable Price: **CHF {int(estimated_price):,}**")
+    st.caption(f"The rent of {DEFAULT_LEVEL:.0%} of the listings our model has not seen during training is within their range. "
+               "The range is wider where the listings of the training data differ more.")
+    if model_name != "unified":
+        st.caption(f"Estimated with the model of the {model_name} region.")
+
+    # Most similar real listings (same ZIP code if possible, similar size, rooms and features)
+    with trace.span("comparables"):
+        comparables_index = load_comparables_index(model_version)
+        if comparables_index is not None:
+            comparables, scope = comparables_index.query(features.iloc[0], k=5)
+            st.subheader("Similar Listings")
+            where = {"zip": f"in ZIP {user_zip}", "area": f"around ZIP {user_zip}", "all": "in all cities"}[scope]
+            st.caption(f"The most similar apartments {where} from the listings our model is trained on.")
+            st.table([{
+                "Address": f"{c['street'] if isinstance(c['street'], str) else '-'}, {int(c['ZIP'])} {c['City']}",
+                "Rooms": f"{c['number_of_rooms']:g}",
+                "Size (m²)": int(c['square_meters']),
+                "Rent (CHF)": f"{int(c['rent']):,}",
+            } for c in comparables])
+
+    # Wait for the location and the amenities (until the deadline), and get the 3 closest places of every amenity
+    # the distances are computed once per amenity and used by the map and the distance list
+    with trace.span("wait_nearby"):
+        lat, lon = lookup.location()
+        amenity_elements = lookup.elements()
+    for stage, (start, end) in list(lookup.timings.items()):
+        trace.add_span(stage, start, end)
+
+    closest_amenities = {amenity: nearest_elements(data, lat, lon, k=3) for amenity, data in amenity_elements.items()}
+    for amenity, reason in lookup.errors.items():
+        if amenity == "location":
+            continue # shown next to the map
+        if reason == "timed out":
+            st.warning(f"{amenity} took too long to load and is not shown, please reload the page in a moment.")
+        else:
+            st.error(f"Failed to retrieve amenities for {amenity}: {reason}")
 
     col1, col2 = st.columns(2)
 
     with col1:  # left side of the page
         st.subheader("Apartment Location & Nearby Amenities")
 
-        # Get location and show location
-        lat, lon = get_location(st.session_state.address, st.session_state.zip_code, st.session_state.city)
-
+        # show location
         if lat and lon:
             m = folium.Map(location=[lat, lon], zoom_start=15)
             folium.Marker([
@@ -324,22 +386,19 @@ if st.session_state.page == "result":
             ], tooltip="Your Apartment", icon=folium.Icon(color="blue", icon="home", prefix='fa')).add_to(m)
 
             # Display amenities
-            geolocator = Nominatim(user_agent='streamlit_app')
-            for amenity in st.session_state.amenities:
-                data = get_amenity_elements(amenity, lat, lon, st.session_state.radius)
-                for el in data[:3]:
-                    el_lat = el.get('lat') or el.get('center', {}).get('lat')
-                    el_lon = el.get('lon') or el.get('center', {}).get('lon')
-                    if el_lat and el_lon:
-                        dist = geodesic((lat, lon), (el_lat, el_lon)).meters
-                        name = el.get('tags', {}).get('name', f"{amenity.title()} (Unnamed)")
-                        folium.Marker(
-                            [el_lat, el_lon],
-                            tooltip=f"{name} — {dist:.0f} m",
-                            icon=folium.Icon(color='green', icon='info-sign')
-                        ).add_to(m)
-
-            st_folium(m, width=600, height=400)
+            for amenity, closest in closest_amenities.items():
+                for el, el_lat, el_lon, dist in closest:
+                    name = el.get('tags', {}).get('name', f"{amenity.title()} (Unnamed)")
+                    folium.Marker(
+                        [el_lat, el_lon],
+                        tooltip=f"{name} — {dist:.0f} m",
+                        icon=folium.Icon(color='green', icon='info-sign')
+                    ).add_to(m)
+
+            with trace.span("map"):
+                st_folium(m, width=600, height=400)
+        elif lookup.errors.get("location") == "timed out":
+            st.warning("Locating your address took too long, please reload the page in a moment.")
         else:
             st.warning("Could not locate your address on the map.")
 
@@ -350,32 +409,25 @@ if st.session_state.page == "result":
             total_displayed = 0  # Counter to limit overall output
             max_results = 9
 
-            for amenity in st.session_state.amenities:
-                try:
-                    data = get_amenity_elements(amenity, lat, lon, st.session_state.radius)
-                    distances = []
-
-                    for el in data:
-                        el_lat = el.get("lat") or el.get("center", {}).get("lat")
-                        el_lon = el.get("lon") or el.get("center", {}).get("lon")
-                        if el_lat and el_lon:
-                            dist = geodesic((lat, lon), (el_lat, el_lon)).meters
-                            name = el.get("tags", {}).get("name", "Unnamed")
-                            distances.append((name, int(dist)))
-
-                    # Sort and limit top 3 per amenity
-                    distances = sorted(distances, key=lambda x: x[1])[:3]
-
-                    for name, dist in distances:
-                        if total_displayed >= max_results:
-                            break
-                        st.write(f"🔹 {amenity.title()}: **{name}** — {dist} m")
-                        total_displayed += 1
-
-                except Exception as e:
-                    st.error(f"Error retrieving {amenity.title()}: {e}")
+            for amenity, closest in closest_amenities.items():
+                for el, _, _, dist in closest:
+                    if total_displayed >= max_results:
+                        break
+                    name = el.get("tags", {}).get("name", "Unnamed")
+                    st.write(f"🔹 {amenity.title()}: **{name}** — {int(dist)} m")
+                    total_displayed += 1
         
     # Option for new entry, goes back to input page
     if st.button("Estimate Another Apartment"):
         st.session_state.page = "input"
-        st.rerun()
\ No newline at end of file
+        st.rerun()
+
+    render = trace.finish()
+
+    # Performance panel, only shown with ?debug=1 in the url or when APP_DEBUG is set
+    if st.query_params.get("debug") == "1" or os.environ.get("APP_DEBUG"):
+        with st.expander("Performance (debug)"):
+            st.write(f"Render time: **{render['total_ms']:.0f} ms**")
+            st.table([{"stage": span["name"], "start (ms)": round(span["start_ms"], 1), "duration (ms)": round(span["duration_ms"], 1)}
+                      for span in render["spans"]])
+            st.table([{"cache": name, **counts} for name, counts in render["caches"].items()])
\ No newline at end of file
@@ -0,0 +1,164 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from amenity_index import METERS_PER_DEG_LAT
+from distances import element_coordinates, haversine_m, top_k_within
+
+# Process wide cache of amenity searches, shared by all sessions of the app
+# A search is stored under (category, snapped tile, radius bucket). The data is requested once for the
+# center of the tile with a radius large enough for every point inside the tile, so any search in the same
+# tile with the same or a smaller radius can be answered by filtering the cached elements.
+# Only what the page shows is kept: the coordinates as float32 arrays (less than 1 m rounding) and the names as
+# one byte string, the rest of the Overpass json is dropped right after the request.
+# The entries have a global memory budget and every session a smaller one for the searches it caused, when one is
+# exceeded the least recently used entries (of that session) are evicted.
+
+TILE_DEG = 0.0025 # ~280 m north-south and ~190 m east-west in Switzerland
+RADIUS_BUCKETS = [500, 1000, 2000, 3000]
+
+
+def snap_to_tile(lat, lon):
+    return int(math.floor(lat / TILE_DEG)), int(math.floor(lon / TILE_DEG))
+
+
+def tile_center(tile):
+    return (tile[0] + 0.5) * TILE_DEG, (tile[1] + 0.5) * TILE_DEG
+
+
+# distance from the tile center to its corner, every point of the tile is at most this far away
+def tile_half_diagonal(tile):
+    lat, _ = tile_center(tile)
+    half_lat = TILE_DEG / 2 * METERS_PER_DEG_LAT
+    half_lon = TILE_DEG / 2 * METERS_PER_DEG_LAT * math.cos(math.radians(lat))
+    return math.hypot(half_lat, half_lon)
+
+
+# smallest bucket that contains the radius, radii above the last bucket are rounded up to 500 m
+def radius_bucket(radius):
+    for bucket in RADIUS_BUCKETS:
+        if radius <= bucket:
+            return bucket
+    return int(math.ceil(radius / 500) * 500)
+
+
+# the places of one amenity search, same order as the Overpass elements
+# the names are one utf-8 byte string with the start of every name in name_offsets, like in the offline index
+class Places:
+
+    __slots__ = ("lat", "lon", "name_offsets", "names")
+
+    def __init__(self, lat, lon, name_offsets, names):
+        self.lat = lat
+        self.lon = lon
+        self.name_offsets = name_offsets
+        self.names = names
+
+    @classmethod
+    def from_elements(cls, elements):
+        located, lats, lons = element_coordinates(elements)
+        names = [str(el.get("tags", {}).get("name", "")).encode("utf-8") for el in located]
+        name_offsets = np.zeros(len(names) + 1, dtype=np.int32)
+        name_offsets[1:] = np.cumsum([len(n) for n in names])
+        return cls(lats.astype(np.float32), lons.astype(np.float32), name_offsets, b"".join(names))
+
+    @property
+    def nbytes(self):
+        return self.lat.nbytes + self.lon.nbytes + self.name_offsets.nbytes + len(self.names) + 400 # arrays and entry overhead
+
+    def name(self, i):
+        return self.names[self.name_offsets[i]:self.name_offsets[i + 1]].decode("utf-8")
+
+    # same structure as the Overpass elements (and the offline index), closest first
+    def elements(self, lat, lon, radius):
+        dist = haversine_m(lat, lon, self.lat.astype(np.float64), self.lon.astype(np.float64))
+        result = []
+        for i in top_k_within(dist, len(dist), radius):
+            name = self.name(i)
+            result.append({"lat": float(self.lat[i]), "lon": float(self.lon[i]), "tags": {"name": name} if name else {}})
+        return result
+
+
+class AmenityCache:
+
+    def __init__(self, ttl=3600, max_bytes=16 * 1024 * 1024, max_session_bytes=1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_session_bytes = max_session_bytes
+        self._entries = OrderedDict() # key -> (expires, places, size, session), least recently used first
+        self._bytes = 0
+        self._session_bytes = {} # session -> bytes of the entries it caused
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._bytes,
+                    "sessions": len(self._session_bytes)}
+
+    def _drop(self, key):
+        _, _, size, session = self._entries.pop(key)
+        self._bytes -= size
+        self._session_bytes[session] -= size
+        if not self._session_bytes[session]:
+            del self._session_bytes[session]
+
+    # cached places of any bucket >= the requested one in this tile, None if nothing usable is cached
+    def _lookup(self, category, tile, bucket):
+        now = time.monotonic()
+        for larger in sorted({bucket, *[b for b in RADIUS_BUCKETS if b >= bucket]}):
+            key = (category, tile, larger)
+            if key not in self._entries:
+                continue
+            expires, places, _, _ = self._entries[key]
+            if expires < now:
+                self._drop(key)
+                continue
+            self._entries.move_to_end(key)
+            return places
+        return None
+
+    def _store(self, key, places, session):
+        size = places.nbytes
+        if size > (self.max_bytes if session is None else min(self.max_bytes, self.max_session_bytes)):
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, places, size, session)
+        self._bytes += size
+        self._session_bytes[session] = self._session_bytes.get(session, 0) + size
+        # the oldest entries of this session first, then the oldest of all
+        while session is not None and self._session_bytes[session] > self.max_session_bytes:
+            self._drop(next(k for k, entry in self._entries.items() if entry[3] == session))
+            self.evictions += 1
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    # elements within radius of lat/lon, fetch(category, lat, lon, radius) is only called on a cache miss
+    # errors of fetch are passed on and nothing is cached, a new entry counts against the budget of session (if given)
+    def get(self, category, lat, lon, radius, fetch, session=None):
+        tile = snap_to_tile(lat, lon)
+        bucket = radius_bucket(radius)
+
+        with self._lock:
+            places = self._lookup(category, tile, bucket)
+            if places is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if places is None:
+            center_lat, center_lon = tile_center(tile)
+            elements = fetch(category, center_lat, center_lon, math.ceil(bucket + tile_half_diagonal(tile)))
+            places = Places.from_elements(elements)
+            with self._lock:
+                self._store((category, tile, bucket), places, session)
+
+        return places.elements(lat, lon, radius)
@@ -0,0 +1,191 @@
+import argparse
+import csv
+import json
+import math
+import os
+
+import numpy as np
+
+from distances import haversine_m
+
+# Offline amenity index, answers the amenity queries of the result page without calling Overpass
+# The points of interest are sorted by category and grid cell and saved as plain .npy files,
+# which are memory-mapped at startup, so every process shares the same pages and nothing is parsed
+
+INDEX_DIR = "amenity_index"
+
+# changes of user tags to actual osm tags
+TAG_MAPPING = {
+    "supermarket": ("shop", "supermarket"),
+    "school": ("amenity", "school"),
+    "hospital": ("amenity", "hospital"),
+    "pharmacy": ("amenity", "pharmacy"),
+    "restaurant": ("amenity", "restaurant")
+}
+
+CELL_DEG = 0.01 # grid cell size in degrees, ~1.1 km north-south and ~0.75 km east-west in Switzerland
+CELLS_PER_ROW = int(round(360 / CELL_DEG))
+METERS_PER_DEG_LAT = 111320.0
+
+
+def cell_rows_cols(lat, lon):
+    rows = np.floor((np.asarray(lat) + 90) / CELL_DEG).astype(np.int64)
+    cols = np.floor((np.asarray(lon) + 180) / CELL_DEG).astype(np.int64)
+    return rows, cols
+
+
+def cell_keys(lat, lon):
+    rows, cols = cell_rows_cols(lat, lon)
+    return rows * CELLS_PER_ROW + cols
+
+
+# Reading the points of interest
+
+# user category of an osm element, None if it is not one of the supported amenities
+def category_of(tags):
+    for category, (tag_key, tag_value) in TAG_MAPPING.items():
+        if tags.get(tag_key) == tag_value:
+            return category
+    return None
+
+
+# Overpass json export (e.g. from overpass turbo with "out center;")
+def read_overpass_json(path):
+    with open(path, encoding="utf-8") as f:
+        elements = json.load(f).get("elements", [])
+    pois = []
+    for el in elements:
+        tags = el.get("tags", {})
+        category = category_of(tags)
+        el_lat = el.get("lat") or el.get("center", {}).get("lat")
+        el_lon = el.get("lon") or el.get("center", {}).get("lon")
+        if category and el_lat and el_lon:
+            pois.append((category, tags.get("name", ""), float(el_lat), float(el_lon)))
+    return pois
+
+
+# csv file with the columns category, name, lat, lon
+def read_poi_csv(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        return [(row["category"].lower(), row.get("name") or "", float(row["lat"]), float(row["lon"]))
+                for row in csv.DictReader(f)]
+
+
+def read_pois(path):
+    if path.lower().endswith(".csv"):
+        return read_poi_csv(path)
+    return read_overpass_json(path)
+
+
+# Building and saving the index
+
+def build_index(pois, index_dir=INDEX_DIR):
+    os.makedirs(index_dir, exist_ok=True)
+    categories = np.array([p[0] for p in pois], dtype=object)
+    lats = np.array([p[2] for p in pois], dtype=np.float64)
+    lons = np.array([p[3] for p in pois], dtype=np.float64)
+    keys = cell_keys(lats, lons)
+
+    # sort by category first and grid cell second, so every category is one block of cells
+    category_ids = {c: i for i, c in enumerate(sorted(set(categories)))}
+    order = np.lexsort((keys, np.array([category_ids[c] for c in categories], dtype=np.int64)))
+
+    names = [pois[i][1].encode("utf-8") for i in order]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    name_offsets[1:] = np.cumsum([len(n) for n in names])
+
+    np.save(os.path.join(index_dir, "lat.npy"), lats[order])
+    np.save(os.path.join(index_dir, "lon.npy"), lons[order])
+    np.save(os.path.join(index_dir, "cell.npy"), keys[order])
+    np.save(os.path.join(index_dir, "name_offsets.npy"), name_offsets)
+    np.save(os.path.join(index_dir, "names.npy"), np.frombuffer(b"".join(names), dtype=np.uint8))
+
+    ranges = {}
+    sorted_categories = categories[order]
+    for category in category_ids:
+        positions = np.flatnonzero(sorted_categories == category)
+        ranges[category] = [int(positions[0]), int(positions[-1]) + 1]
+    with open(os.path.join(index_dir, "categories.json"), "w") as f:
+        json.dump(ranges, f, indent=2)
+    return len(pois)
+
+
+class AmenityIndex:
+
+    def __init__(self, index_dir=INDEX_DIR):
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+        self.lat = load("lat.npy")
+        self.lon = load("lon.npy")
+        self.cell = load("cell.npy")
+        self.name_offsets = load("name_offsets.npy")
+        self.names = load("names.npy")
+        with open(os.path.join(index_dir, "categories.json")) as f:
+            self.categories = {c: tuple(r) for c, r in json.load(f).items()}
+
+    @staticmethod
+    def exists(index_dir=INDEX_DIR):
+        return os.path.exists(os.path.join(index_dir, "categories.json"))
+
+    def name(self, i):
+        return bytes(self.names[self.name_offsets[i]:self.name_offsets[i + 1]]).decode("utf-8")
+
+    # positions of all points of a category in the grid cells touching the circle around lat/lon
+    def _candidates(self, category, lat, lon, radius):
+        if category not in self.categories:
+            return np.empty(0, dtype=np.int64)
+        start, end = self.categories[category]
+        cells = self.cell[start:end]
+
+        dlat = radius / METERS_PER_DEG_LAT
+        dlon = radius / (METERS_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        (row_min, row_max), (col_min, col_max) = cell_rows_cols([lat - dlat, lat + dlat], [lon - dlon, lon + dlon])
+
+        # one row of cells is a contiguous block of keys, so every row is a single binary search
+        rows = np.arange(row_min, row_max + 1) * CELLS_PER_ROW
+        lo = np.searchsorted(cells, rows + col_min, side="left")
+        hi = np.searchsorted(cells, rows + col_max, side="right")
+        if not len(lo) or (hi - lo).sum() == 0:
+            return np.empty(0, dtype=np.int64)
+        return start + np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])
+
+    # all points of a category within radius meters, sorted by distance
+    def within(self, category, lat, lon, radius):
+        candidates = self._candidates(category.lower(), lat, lon, radius)
+        dist = haversine_m(lat, lon, self.lat[candidates], self.lon[candidates])
+        inside = dist <= radius
+        candidates, dist = candidates[inside], dist[inside]
+        order = np.argsort(dist, kind="stable")
+        return candidates[order], dist[order]
+
+    # the k closest points of a category, the search circle grows until k points are inside it
+    def nearest(self, category, lat, lon, k, max_radius=20000):
+        radius = 250.0
+        while True:
+            positions, dist = self.within(category, lat, lon, radius)
+            if len(positions) >= k or radius >= max_radius:
+                return positions[:k], dist[:k]
+            radius = min(radius * 2, max_radius)
+
+    # same structure as the Overpass elements the result page already knows how to show
+    def elements(self, category, lat, lon, radius):
+        positions, _ = self.within(category, lat, lon, radius)
+        result = []
+        for i in positions:
+            name = self.name(i)
+            result.append({
+                "lat": float(self.lat[i]),
+                "lon": float(self.lon[i]),
+                "tags": {"name": name} if name else {}
+            })
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline amenity index from an Overpass json export or a csv file (category, name, lat, lon).")
+    parser.add_argument("source", help="Overpass json export or csv file with the points of interest")
+    parser.add_argument("--out", default=INDEX_DIR, help=f"folder of the index (default: {INDEX_DIR})")
+    args = parser.parse_args()
+
+    count = build_index(read_pois(args.source), args.out)
+    print(f"Amenity index with {count} places saved to '{args.out}'")
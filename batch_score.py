@@ -0,0 +1,112 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from diagnostics import load_calibration
+from features import FEATURE_COLUMNS, listing_features
+from intervals import DEFAULT_LEVEL, LEVELS, predict_interval
+
+# Scores whole listing exports with price_estimator.pkl
+# The input csv (same ;-separated schema as the city files) is read in chunks, every chunk goes through the same
+# feature preparation as the app and the trainer and is estimated in a pool of worker processes that load the model once.
+# The price range is the calibrated range of the random forest (see intervals.py), the same as on the result page.
+#
+#   python batch_score.py listings.csv scored_listings.csv --workers 4
+
+MODEL_FILE = "price_estimator.pkl"
+_model = None # model of the current worker process
+_calibration = None
+
+
+def _init_worker(model_file, calibration):
+    global _model, _calibration
+    _model = joblib.load(model_file)
+    _calibration = calibration
+
+
+# estimated rent, price range and verdict for every row of one chunk
+def score_chunk(raw_chunk, level=DEFAULT_LEVEL):
+    listings, complete = listing_features(raw_chunk)
+
+    predicted, lower, upper = (np.full(len(listings), np.nan) for _ in range(3))
+    if complete.any():
+        predicted[complete], lower[complete], upper[complete] = predict_interval(
+            _model, listings.loc[complete, FEATURE_COLUMNS], _calibration, level)
+
+    scored = raw_chunk.reset_index(drop=True).copy()
+    scored['predicted_rent'] = predicted.round(0)
+    scored['lower_bound'] = lower.round(0)
+    scored['upper_bound'] = upper.round(0)
+
+    rent = listings['rent'].to_numpy()
+    verdict = np.full(len(listings), "", dtype=object)
+    known = ~np.isnan(predicted) & ~np.isnan(rent)
+    verdict[known] = "fair"
+    verdict[known & (rent > scored['upper_bound'].to_numpy())] = "overpriced"
+    verdict[known & (rent < scored['lower_bound'].to_numpy())] = "underpriced"
+    scored['verdict'] = verdict
+    return scored, int((~complete).sum())
+
+
+def score_file(input_file, output_file, model_file=MODEL_FILE, chunksize=5000, workers=None, level=DEFAULT_LEVEL):
+    workers = workers or os.cpu_count() or 1
+    # calibrated on the test listings of the trainer, loaded once and passed to the workers
+    calibration = load_calibration(joblib.load(model_file), model_file)
+    chunks = pd.read_csv(input_file, encoding="latin1", sep=";", chunksize=chunksize)
+
+    start = time.perf_counter()
+    rows = skipped = 0
+    header = True
+
+    def write(result):
+        nonlocal rows, skipped, header
+        scored, not_scored = result
+        scored.to_csv(output_file, sep=";", index=False, mode="w" if header else "a", header=header, encoding="latin1", errors="replace")
+        header = False
+        rows += len(scored)
+        skipped += not_scored
+
+    if workers == 1:
+        _init_worker(model_file, calibration)
+        for chunk in chunks:
+            write(score_chunk(chunk, level))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_file, calibration)) as pool:
+            # only a few chunks are in flight at once, so the input is never fully in memory
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(score_chunk, chunk, level))
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+
+    elapsed = time.perf_counter() - start
+    return {"rows": rows, "not_scored": skipped, "seconds": elapsed, "rows_per_second": rows / elapsed if elapsed else 0.0}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the fair rent of every listing in a csv export.")
+    parser.add_argument("input", help="listings in the ;-separated schema of the city csv files")
+    parser.add_argument("output", help="csv file for the listings with predicted_rent, lower_bound, upper_bound and verdict")
+    parser.add_argument("--model", default=MODEL_FILE, help=f"model file (default: {MODEL_FILE})")
+    parser.add_argument("--chunksize", type=int, default=5000, help="rows per chunk (default: 5000)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--level", type=float, default=DEFAULT_LEVEL, choices=LEVELS,
+                        help=f"share of the rents inside the fair price range (default: {DEFAULT_LEVEL})")
+    args = parser.parse_args()
+
+    try:
+        report = score_file(args.input, args.output, args.model, args.chunksize, args.workers, args.level)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Scored {report['rows']:,} listings in {report['seconds']:.1f} s ({report['rows_per_second']:,.0f} rows/s)")
+    if report["not_scored"]:
+        print(f"{report['not_scored']:,} listings could not be estimated because ZIP, rooms, size or place type is missing")
+    print(f"Results saved to '{args.output}'")
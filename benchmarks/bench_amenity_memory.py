@@ -0,0 +1,126 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+
+# Memory footprint of the amenity searches of many sessions
+# Simulates sessions that each search a few amenities around random addresses with radii up to 3000 m, answered by
+# a local stand-in for Overpass with realistic tags. Compares keeping the decoded Overpass json of every search
+# (what the app did before) with the compact, budgeted AmenityCache, measured with tracemalloc.
+#
+#   python benchmarks/bench_amenity_memory.py --sessions 200 --searches 10 --max-mb 4
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from amenity_cache import AmenityCache  # noqa: E402
+from amenity_index import TAG_MAPPING  # noqa: E402
+
+CITIES = [(47.3769, 8.5417), (46.2044, 6.1432), (46.5197, 6.6323), (47.4245, 9.3767)]
+RADII = [300, 500, 1000, 2000, 3000]
+PLACES_PER_KM2 = {"supermarket": 15, "school": 10, "hospital": 1, "pharmacy": 8, "restaurant": 60}
+CHAINS = ["Migros", "Coop", "Denner", "Aldi", "Lidl", "Amavita", "Sun Store", "McDonald's"]
+
+
+# Overpass answer for a search, the same places every time for the same arguments
+def overpass_answer(category, lat, lon, radius):
+    seed = zlib.crc32(f"{category} {lat:.5f} {lon:.5f} {radius}".encode())
+    rng = np.random.default_rng(seed)
+    count = rng.poisson(PLACES_PER_KM2[category] * np.pi * (radius / 1000) ** 2)
+    tag_key, tag_value = TAG_MAPPING[category]
+    dlat = radius / 111320
+    dlon = dlat / np.cos(np.radians(lat))
+    lats = lat + rng.uniform(-dlat, dlat, count)
+    lons = lon + rng.uniform(-dlon, dlon, count)
+    ids = rng.integers(1e10, size=count)
+    chains = rng.integers(len(CHAINS), size=count)
+    is_chain = rng.random(count) < 0.4
+    elements = [{
+        "type": "node", "id": int(ids[i]), "lat": float(lats[i]), "lon": float(lons[i]),
+        "tags": {tag_key: tag_value, "name": CHAINS[chains[i]] if is_chain[i] else f"{tag_value.title()} {ids[i] % 99991}",
+                 "addr:street": "Bahnhofstrasse", "addr:housenumber": str(i), "addr:postcode": "8001",
+                 "addr:city": "Zürich", "opening_hours": "Mo-Sa 08:00-20:00", "wheelchair": "yes",
+                 "website": f"https://example.ch/{ids[i]}"},
+    } for i in range(count)]
+    # what requests gives back after json decoding
+    return json.loads(json.dumps(elements))
+
+
+# (session, category, lat, lon, radius) of every search, sessions search around their own address
+def simulated_searches(sessions, searches, seed=0):
+    rng = np.random.default_rng(seed)
+    categories = list(PLACES_PER_KM2)
+    result = []
+    for session in range(sessions):
+        city_lat, city_lon = CITIES[rng.integers(len(CITIES))]
+        lat, lon = city_lat + rng.uniform(-0.02, 0.02), city_lon + rng.uniform(-0.03, 0.03)
+        for _ in range(searches):
+            result.append((f"s{session}", categories[rng.integers(len(categories))], lat, lon, int(rng.choice(RADII))))
+    return result
+
+
+# the old way, every search keeps its decoded Overpass elements
+def run_raw(searches):
+    tracemalloc.start()
+    kept = {}
+    start = time.perf_counter()
+    for session, category, lat, lon, radius in searches:
+        kept.setdefault(session, []).append(overpass_answer(category, lat, lon, radius))
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"retained_mb": current / 2 ** 20, "peak_mb": peak / 2 ** 20, "search_ms": seconds / len(searches) * 1000,
+            "elements": sum(len(e) for lists in kept.values() for e in lists)}
+
+
+def run_compact(searches, max_mb, session_mb):
+    tracemalloc.start()
+    cache = AmenityCache(max_bytes=int(max_mb * 2 ** 20), max_session_bytes=int(session_mb * 2 ** 20))
+    start = time.perf_counter()
+    for session, category, lat, lon, radius in searches:
+        cache.get(category, lat, lon, radius, overpass_answer, session)
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # the same searches again, now mostly answered from the cache
+    start = time.perf_counter()
+    for session, category, lat, lon, radius in searches:
+        cache.get(category, lat, lon, radius, overpass_answer, session)
+    repeat_seconds = time.perf_counter() - start
+    stats = cache.stats()
+    return {"retained_mb": current / 2 ** 20, "peak_mb": peak / 2 ** 20, "search_ms": seconds / len(searches) * 1000,
+            "repeat_search_ms": repeat_seconds / len(searches) * 1000, "cache_mb": stats["bytes"] / 2 ** 20,
+            "entries": stats["entries"], "evictions": stats["evictions"],
+            "hit_rate": stats["hits"] / max(stats["hits"] + stats["misses"], 1), "budget_mb": max_mb, "session_budget_mb": session_mb}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory footprint of the amenity searches of many sessions.")
+    parser.add_argument("--sessions", type=int, default=200, help="simulated sessions (default: 200)")
+    parser.add_argument("--searches", type=int, default=10, help="amenity searches per session (default: 10)")
+    parser.add_argument("--max-mb", type=float, default=16, help="global cache budget in MB (default: 16)")
+    parser.add_argument("--session-mb", type=float, default=1, help="cache budget per session in MB (default: 1)")
+    parser.add_argument("--output", default="amenity_memory_report.json", help="json report (default: amenity_memory_report.json)")
+    args = parser.parse_args()
+
+    searches = simulated_searches(args.sessions, args.searches)
+    raw = run_raw(searches)
+    compact = run_compact(searches, args.max_mb, args.session_mb)
+    report = {"sessions": args.sessions, "searches": len(searches), "raw_json": raw, "compact_cache": compact}
+
+    print(f"{args.sessions} sessions, {len(searches)} searches, {raw['elements']:,} places")
+    print(f"decoded Overpass json  {raw['retained_mb']:8.1f} MB retained  (peak {raw['peak_mb']:.1f} MB)")
+    print(f"compact cache          {compact['retained_mb']:8.1f} MB retained  (peak {compact['peak_mb']:.1f} MB, "
+          f"cache entries {compact['cache_mb']:.1f} MB, budget {args.max_mb:g} MB)")
+    print(f"entries {compact['entries']}, evictions {compact['evictions']}, hit rate {compact['hit_rate']:.0%}, "
+          f"repeated search {compact['repeat_search_ms']:.2f} ms")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to '{args.output}'")
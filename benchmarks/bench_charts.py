@@ -0,0 +1,83 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import matplotlib
+import numpy as np
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+# Render time and memory of the predicted vs. actual diagram for growing test sets
+# "pyplot" is how the result page drew it before (every test point with the global pyplot state, figures never
+# closed, saved like st.pyplot does), "cached" is charts.py (background rendered once, only the point per render).
+# With the cached diagram both numbers should stay the same no matter how large the test set is.
+#
+#   python benchmarks/bench_charts.py --sizes 1000 10000 100000 --renders 20
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from charts import ScatterBackground  # noqa: E402
+
+
+def test_set(size, seed=0):
+    rng = np.random.default_rng(seed)
+    actual = rng.lognormal(np.log(2500), 0.5, size)
+    return actual, actual * rng.normal(1, 0.15, size)
+
+
+def render_pyplot(actual, predicted, user_actual, user_predicted):
+    plt.figure(figsize=(8, 6))
+    plt.scatter(actual, predicted, alpha=0.6, label='Training Data Predictions')
+    plt.plot([actual.min(), actual.max()], [actual.min(), actual.max()], 'r--', label='Ideal Prediction Line')
+    plt.scatter(user_actual, user_predicted, color='red', s=100, label='Entered Apartment')
+    plt.legend()
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format="png", dpi=200, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def measure(render, renders, rng):
+    tracemalloc.start()
+    times = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        render(rng.uniform(1500, 4000), rng.uniform(1500, 4000))
+        times.append(time.perf_counter() - start)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"render_ms": float(np.median(times)) * 1000, "retained_mb": current / 2 ** 20}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render time and memory of the predicted vs. actual diagram.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="test set sizes (default: 1000 10000 100000)")
+    parser.add_argument("--renders", type=int, default=20, help="renders per size (default: 20)")
+    parser.add_argument("--output", default="charts_report.json", help="json report (default: charts_report.json)")
+    args = parser.parse_args()
+
+    report = {"renders": args.renders, "sizes": []}
+    for size in args.sizes:
+        actual, predicted = test_set(size)
+        rng = np.random.default_rng(1)
+        old = measure(lambda a, p: render_pyplot(actual, predicted, a, p), args.renders, rng)
+        plt.close("all")
+
+        start = time.perf_counter()
+        background = ScatterBackground(actual, predicted, (float(actual.min()), float(actual.max())))
+        background_ms = (time.perf_counter() - start) * 1000
+        new = measure(background.with_point, args.renders, rng)
+        new["background_ms"] = background_ms
+
+        report["sizes"].append({"size": size, "pyplot": old, "cached": new})
+        print(f"{size:>9,} test listings  pyplot {old['render_ms']:8.1f} ms/render {old['retained_mb']:7.1f} MB retained   "
+              f"cached {new['render_ms']:6.1f} ms/render {new['retained_mb']:5.1f} MB retained (background once {background_ms:.0f} ms)")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to '{args.output}'")
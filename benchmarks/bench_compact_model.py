@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_squared_error
+
+# Compares the current price estimator with smaller variants and the compact (memory-mapped) artifact:
+# RMSE, file size, load time, memory after loading and single-row / batch predict latency
+#
+#   python benchmarks/bench_compact_model.py --output compact_model_report.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compact_forest import CompactForest, compact_size, export_compact  # noqa: E402
+from train_model_all_cities import build_pipeline, load_training_data, split  # noqa: E402
+
+VARIANTS = {
+    "current (100 trees)": {},
+    "50 trees": {"n_estimators": 50},
+    "100 trees, min 3 per leaf": {"min_samples_leaf": 3},
+    "100 trees, depth 12": {"max_depth": 12},
+    "50 trees, depth 12, min 3 per leaf": {"n_estimators": 50, "max_depth": 12, "min_samples_leaf": 3},
+}
+
+
+def median_ms(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+# load time and Python heap memory of loading a model
+def measure_load(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    model = load()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return model, seconds * 1000, peak / 1e6
+
+
+def measure(name, model_kind, load, size_bytes, X_test, y_test, X_batch, repeat):
+    model, load_ms, heap_mb = measure_load(load)
+    one_row = X_test.iloc[[0]]
+    return {
+        "variant": name,
+        "artifact": model_kind,
+        "rmse": float(mean_squared_error(y_test, model.predict(X_test), squared=False)),
+        "size_mb": size_bytes / 1e6,
+        "load_ms": load_ms,
+        "heap_mb_after_load": heap_mb,
+        "single_row_ms": median_ms(lambda: model.predict(one_row), repeat),
+        "batch_rows": len(X_batch),
+        "batch_ms": median_ms(lambda: model.predict(X_batch), max(3, repeat // 10)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency/accuracy trade-off of compact price estimator variants.")
+    parser.add_argument("--output", default="compact_model_report.json", help="json report (default: compact_model_report.json)")
+    parser.add_argument("--batch-rows", type=int, default=10000, help="rows of the batch predict test (default: 10000)")
+    parser.add_argument("--repeat", type=int, default=50, help="repetitions of the single-row test (default: 50)")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    X, y = load_training_data(verbose=False)
+    X_train, X_test, y_train, y_test = split(X, y)
+    X_batch = pd.concat([X_test] * (args.batch_rows // len(X_test) + 1)).iloc[:args.batch_rows]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, params in VARIANTS.items():
+            pipeline = build_pipeline(**params).fit(X_train, y_train)
+
+            pickle_file = os.path.join(tmp, "model.pkl")
+            joblib.dump(pipeline, pickle_file)
+            results.append(measure(name, "pickle", lambda: joblib.load(pickle_file), os.path.getsize(pickle_file),
+                                   X_test, y_test, X_batch, args.repeat))
+
+            compact_dir = os.path.join(tmp, "compact")
+            export_compact(pipeline, compact_dir)
+            results.append(measure(name, "compact", lambda: CompactForest(compact_dir), compact_size(compact_dir),
+                                   X_test, y_test, X_batch, args.repeat))
+            print(f"measured {name}")
+
+    with open(args.output, "w") as f:
+        json.dump({"test_rows": len(X_test), "results": results}, f, indent=2)
+
+    print()
+    print(f"{'variant':36} {'artifact':8} {'RMSE':>8} {'MB':>6} {'load ms':>8} {'heap MB':>8} {'1 row ms':>9} {'batch ms':>9}")
+    for r in results:
+        print(f"{r['variant']:36} {r['artifact']:8} {r['rmse']:8.0f} {r['size_mb']:6.1f} {r['load_ms']:8.1f} "
+              f"{r['heap_mb_after_load']:8.1f} {r['single_row_ms']:9.2f} {r['batch_ms']:9.1f}")
+    print(f"\nReport saved to '{args.output}'")
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Cost and accuracy of the price ranges of intervals.py
+# Latency of predict, of the batched range (one pass over all trees) and of the obvious loop over estimators_,
+# for one row and a batch, with the pipeline and the compact model. The coverage of every level is measured on
+# half of the held-out listings after calibrating on the other half.
+#
+#   python benchmarks/bench_intervals.py --output intervals_report.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compact_forest import CompactForest, export_compact  # noqa: E402
+from intervals import LEVELS, calibrate, coverage, predict_interval  # noqa: E402
+from train_model_all_cities import build_pipeline, load_training_data, split  # noqa: E402
+
+
+def median_ms(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+# the per request loop the batched version replaces
+def looped_interval(pipeline, X):
+    Xt = pipeline.named_steps['preprocessor'].transform(X)
+    predictions = np.column_stack([tree.predict(Xt) for tree in pipeline.named_steps['regressor'].estimators_])
+    return predictions.mean(axis=1), np.percentile(predictions, 10, axis=1), np.percentile(predictions, 90, axis=1)
+
+
+def latencies(model, X, calibration, repeat, pipeline=None):
+    one, batch = X.iloc[:1], X
+    result = {
+        "predict_single_ms": median_ms(lambda: model.predict(one), repeat),
+        "interval_single_ms": median_ms(lambda: predict_interval(model, one, calibration), repeat),
+        "predict_batch_ms": median_ms(lambda: model.predict(batch), max(repeat // 10, 3)),
+        "interval_batch_ms": median_ms(lambda: predict_interval(model, batch, calibration), max(repeat // 10, 3)),
+    }
+    if pipeline is not None:
+        result["loop_single_ms"] = median_ms(lambda: looped_interval(pipeline, one), repeat)
+        result["loop_batch_ms"] = median_ms(lambda: looped_interval(pipeline, batch), max(repeat // 10, 3))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency and coverage of the price ranges of the random forest.")
+    parser.add_argument("--repeat", type=int, default=50, help="timed calls per single-row measurement (default: 50)")
+    parser.add_argument("--output", default="intervals_report.json", help="json report (default: intervals_report.json)")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    X, y = load_training_data(verbose=False)
+    X_train, X_test, y_train, y_test = split(X, y)
+    pipeline = build_pipeline().fit(X_train, y_train)
+
+    # coverage on listings that were not used for the calibration
+    half = len(y_test) // 2
+    calibration = calibrate(pipeline, X_test.iloc[:half], y_test.iloc[:half])
+    report = {"test_rows": len(y_test), "calibration_rows": half, "coverage": {}, "latency": {}}
+    for level in LEVELS:
+        _, lower, upper = predict_interval(pipeline, X_test.iloc[half:], calibration, level)
+        report["coverage"][str(level)] = coverage(y_test.iloc[half:], lower, upper)
+
+    report["latency"]["pipeline"] = latencies(pipeline, X_test, calibration, args.repeat, pipeline)
+    with tempfile.TemporaryDirectory() as compact_dir:
+        export_compact(pipeline, compact_dir)
+        report["latency"]["compact"] = latencies(CompactForest(compact_dir), X_test, calibration, args.repeat)
+
+    print("Coverage of the ranges on held-out listings:")
+    for level, share in report["coverage"].items():
+        print(f"  {float(level):.0%} range contains {share:.1%} of the rents")
+    for name, result in report["latency"].items():
+        print(f"{name}:")
+        print(f"  1 row       predict {result['predict_single_ms']:7.2f} ms   range {result['interval_single_ms']:7.2f} ms"
+              + (f"   loop over trees {result['loop_single_ms']:7.2f} ms" if "loop_single_ms" in result else ""))
+        print(f"  {len(X_test)} rows    predict {result['predict_batch_ms']:7.2f} ms   range {result['interval_batch_ms']:7.2f} ms"
+              + (f"   loop over trees {result['loop_batch_ms']:7.2f} ms" if "loop_batch_ms" in result else ""))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to '{args.output}'")
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import sklearn
+
+# Times every stage of the data pipeline on synthetic listing files of growing size
+# ingestion/cleaning (cold and cached), keyword features, training, single-row and batch predict, market stats
+# and distance computation. Geocoding and the amenity lookups run against local stand-ins instead of
+# Nominatim/Overpass, so the numbers only depend on our own code. The report is written as json and can be
+# compared with an older report to catch stages that got slower or scale worse than before.
+#
+#   python benchmarks/bench_pipeline.py --sizes 10000 100000 1000000 --output pipeline_report.json
+#   python benchmarks/bench_pipeline.py --baseline pipeline_report.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from amenity_cache import AmenityCache  # noqa: E402
+from amenity_index import AmenityIndex, build_index  # noqa: E402
+from distances import haversine_m, nearest_elements  # noqa: E402
+from features import FEATURE_COLUMNS, add_keyword_features  # noqa: E402
+from geocoding import GeocodeCache, Geocoder, Location, TokenBucket  # noqa: E402
+from ingestion import REQUIRED_COLUMNS, load_listings  # noqa: E402
+from market_stats import build_market_stats, load_market_stats  # noqa: E402
+from synthetic_listings import write_listings  # noqa: E402
+from train_model_all_cities import build_pipeline, split  # noqa: E402
+
+ZURICH = (47.3769, 8.5417)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def median_seconds(function, repeat):
+    return float(np.median([timed(function)[1] for _ in range(repeat)]))
+
+
+# random points of interest around Zurich as Overpass elements
+def synthetic_elements(count, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = ZURICH[0] + rng.uniform(-0.05, 0.05, count)
+    lons = ZURICH[1] + rng.uniform(-0.07, 0.07, count)
+    return [{"type": "node", "id": i, "lat": float(lat), "lon": float(lon), "tags": {"name": f"Place {i}"}}
+            for i, (lat, lon) in enumerate(zip(lats, lons))]
+
+
+# stand-in for NominatimBackend, answers every address without a request
+class LocalGeocodingBackend:
+
+    def __init__(self):
+        self.requests = 0
+
+    def geocode(self, query):
+        self.requests += 1
+        offset = (hash(query) % 1000) / 1e5
+        return Location(ZURICH[0] + offset, ZURICH[1] - offset, query)
+
+
+def bench_size(rows, workdir, args):
+    result = {"rows": rows}
+    csv_file = f"synthetic_{rows}.csv"
+    if not os.path.exists(csv_file):
+        _, result["generate_s"] = timed(write_listings, csv_file, rows)
+    result["file_mb"] = os.path.getsize(csv_file) / 1e6
+
+    # ingestion: parsing and cleaning the csv, then the same call answered from the parquet cache
+    shutil.rmtree(".listings_cache", ignore_errors=True)
+    _, result["ingest_cold_s"] = timed(load_listings, [csv_file])
+    data, result["ingest_cached_s"] = timed(load_listings, [csv_file])
+
+    data = data.dropna(subset=REQUIRED_COLUMNS)
+    data, result["keyword_features_s"] = timed(add_keyword_features, data)
+    X, y = data[FEATURE_COLUMNS], data['rent']
+    X_train, X_test, y_train, y_test = split(X, y)
+
+    # training gets slow quickly, large files are trained on a sample of max_train_rows listings
+    if len(X_train) > args.max_train_rows:
+        X_train = X_train.sample(args.max_train_rows, random_state=42)
+        y_train = y_train.loc[X_train.index]
+    result["train_rows"] = len(X_train)
+    model, result["train_s"] = timed(build_pipeline(n_estimators=args.trees, n_jobs=args.jobs).fit, X_train, y_train)
+
+    one_row = X_test.iloc[[0]]
+    result["predict_single_ms"] = median_seconds(lambda: model.predict(one_row), args.repeat) * 1000
+    _, result["predict_batch_s"] = timed(model.predict, X)
+    result["predict_batch_rows_per_second"] = len(X) / result["predict_batch_s"]
+
+    # market stats: aggregation over the cached listings, then the rebuild check of the saved index
+    _, result["market_stats_build_s"] = timed(build_market_stats, [csv_file])
+    if os.path.exists("market_stats.pkl"):
+        os.remove("market_stats.pkl")
+    _, result["market_stats_cold_s"] = timed(load_market_stats, [csv_file], "market_stats.pkl")
+    _, result["market_stats_cached_s"] = timed(load_market_stats, [csv_file], "market_stats.pkl")
+
+    # distances: one origin against as many points of interest as there are listings
+    elements = synthetic_elements(rows)
+    lats = np.array([el["lat"] for el in elements])
+    lons = np.array([el["lon"] for el in elements])
+    result["haversine_ms"] = median_seconds(lambda: haversine_m(*ZURICH, lats, lons), args.repeat) * 1000
+    result["nearest_elements_ms"] = median_seconds(lambda: nearest_elements(elements, *ZURICH, 5, 3000), max(3, args.repeat // 10)) * 1000
+
+    pois = [("Supermarket", el["tags"]["name"], el["lat"], el["lon"]) for el in elements]
+    shutil.rmtree("amenity_index", ignore_errors=True)
+    _, result["amenity_index_build_s"] = timed(build_index, pois, "amenity_index")
+    index = AmenityIndex("amenity_index")
+    result["amenity_index_query_ms"] = median_seconds(lambda: index.within("Supermarket", *ZURICH, 1000), args.repeat) * 1000
+    return result
+
+
+# geocoding and amenity lookups with local stand-ins, measures our caching layers without the network
+def bench_services(queries, workdir):
+    result = {"queries": queries}
+    backend = LocalGeocodingBackend()
+    cache_file = os.path.join(workdir, "geocode_cache.sqlite")
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+    geocoder = Geocoder(backend, GeocodeCache(cache_file), TokenBucket(rate=1e9, capacity=1e9))
+    addresses = [f"Teststrasse {i}, 8001 Zurich" for i in range(queries)]
+    _, seconds = timed(lambda: [geocoder.geocode(a) for a in addresses])
+    result["geocode_miss_ms"] = seconds / queries * 1000
+    _, seconds = timed(lambda: [geocoder.geocode(a.upper()) for a in addresses])
+    result["geocode_hit_ms"] = seconds / queries * 1000
+    result["geocode_backend_requests"] = backend.requests
+
+    elements = synthetic_elements(2000)
+    cache = AmenityCache()
+    rng = np.random.default_rng(1)
+    homes = np.column_stack([ZURICH[0] + rng.uniform(-0.02, 0.02, queries), ZURICH[1] + rng.uniform(-0.02, 0.02, queries)])
+    _, seconds = timed(lambda: [cache.get("Supermarket", lat, lon, 1000, lambda *_: elements) for lat, lon in homes])
+    result["amenity_lookup_ms"] = seconds / queries * 1000
+    result["amenity_cache"] = cache.stats()
+    return result
+
+
+# growth of a stage between two sizes, 1.0 means linear in the number of rows
+def scaling_exponents(sizes):
+    exponents = {}
+    for small, large in zip(sizes, sizes[1:]):
+        for stage, value in large.items():
+            before = small.get(stage)
+            if stage.endswith(("_s", "_ms")) and before and value and stage != "generate_s":
+                exponents.setdefault(stage, {})[f"{small['rows']}->{large['rows']}"] = round(
+                    float(np.log(value / before) / np.log(large['rows'] / small['rows'])), 2)
+    return exponents
+
+
+# stages that are more than tolerance slower than in the baseline report
+def regressions(report, baseline, tolerance):
+    slower = []
+    old_sizes = {str(s["rows"]): s for s in baseline.get("sizes", [])}
+    for size in report["sizes"]:
+        old = old_sizes.get(str(size["rows"]), {})
+        for stage, value in size.items():
+            if stage.endswith(("_s", "_ms")) and stage != "generate_s" and old.get(stage) and value > old[stage] * (1 + tolerance):
+                slower.append(f"{stage} at {size['rows']:,} rows: {old[stage]:.4g} -> {value:.4g}")
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the listing pipeline on synthetic data of growing size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="rows per run (default: 10000 100000 1000000)")
+    parser.add_argument("--output", default="pipeline_report.json", help="json report (default: pipeline_report.json)")
+    parser.add_argument("--workdir", default=None, help="keep the generated files here and reuse them in later runs (default: temporary folder)")
+    parser.add_argument("--trees", type=int, default=100, help="trees of the benchmarked model (default: 100, same as the trainer)")
+    parser.add_argument("--jobs", type=int, default=None, help="n_jobs of the random forest (default: sklearn's default)")
+    parser.add_argument("--max-train-rows", type=int, default=100000, help="larger training sets are sampled down to this (default: 100000)")
+    parser.add_argument("--repeat", type=int, default=50, help="repetitions of the short measurements (default: 50)")
+    parser.add_argument("--queries", type=int, default=1000, help="geocoding and amenity lookups of the service stage (default: 1000)")
+    parser.add_argument("--baseline", default=None, help="older report, stages that got slower are listed and the exit code is 1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline (default: 0.25)")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline_file = os.path.abspath(args.baseline) if args.baseline else None
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir) # all caches of the pipeline are created here, not next to the real city files
+
+    report = {
+        "environment": {
+            "python": platform.python_version(), "numpy": np.__version__, "sklearn": sklearn.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "settings": {"trees": args.trees, "jobs": args.jobs, "max_train_rows": args.max_train_rows, "repeat": args.repeat},
+        "sizes": [],
+    }
+    try:
+        for rows in sorted(args.sizes):
+            report["sizes"].append(bench_size(rows, workdir, args))
+            size = report["sizes"][-1]
+            print(f"{rows:>9,} rows  ingest {size['ingest_cold_s']:6.2f} s (cached {size['ingest_cached_s']:5.2f} s)  "
+                  f"keywords {size['keyword_features_s']:5.2f} s  train {size['train_s']:6.1f} s  "
+                  f"predict 1 row {size['predict_single_ms']:5.1f} ms / all {size['predict_batch_s']:6.2f} s  "
+                  f"market stats {size['market_stats_build_s']:5.2f} s  haversine {size['haversine_ms']:6.2f} ms")
+        report["services"] = bench_services(args.queries, workdir)
+    finally:
+        os.chdir(ROOT)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    services = report["services"]
+    print(f"geocoding {services['geocode_miss_ms']:.3f} ms per new / {services['geocode_hit_ms']:.3f} ms per known address, "
+          f"amenity lookup {services['amenity_lookup_ms']:.3f} ms ({services['amenity_cache']['hits']} cache hits)")
+
+    report["scaling"] = scaling_exponents(report["sizes"])
+    for stage, exponents in report["scaling"].items():
+        print(f"  {stage:28} " + "  ".join(f"{step}: {e:.2f}" for step, e in exponents.items()))
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to '{output}'")
+
+    if baseline_file:
+        with open(baseline_file) as f:
+            slower = regressions(report, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"slower than baseline: {line}")
+        if slower:
+            sys.exit(1)
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Startup budget of the Streamlit pages
+# Every page is rendered once in a fresh Python process with streamlit's AppTest, which measures the cold import
+# time plus the time until the page is drawn (time to first paint). It also records which heavy modules were
+# loaded, so a page that suddenly imports the model, plotting or mapping stack shows up as a regression.
+#
+#   python benchmarks/bench_startup.py --output startup_report.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "sklearn", "joblib", "matplotlib", "folium", "streamlit_folium", "geopy", "requests"]
+
+RESULT_STATE = {
+    "page": "result", "address": "Bahnhofstrasse 1", "zip_code": "8001", "city": "Zurich", "size": 80, "rooms": 3.0,
+    "demanded_rent": 3000, "outdoor_space": "Balcony", "is_renovated": "Yes", "parking": "No", "amenities": [], "radius": 500,
+}
+
+# page name -> (script, session state, render budget in ms, modules the page must not load)
+PAGES = {
+    "welcome": ("Fair_Rental_Price_Evaluator.py", {"page": "welcome"}, 1000,
+                ["sklearn", "joblib", "matplotlib", "folium", "streamlit_folium", "pandas"]),
+    "input": ("Fair_Rental_Price_Evaluator.py", {"page": "input"}, 1000,
+              ["sklearn", "joblib", "matplotlib", "folium", "streamlit_folium", "pandas"]),
+    "result": ("Fair_Rental_Price_Evaluator.py", RESULT_STATE, 5000, []),
+    "specific_amenities_finder": ("pages/Specific_Amenities_Finder.py", {}, 1000, ["folium", "geopy", "requests"]),
+}
+
+# runs in the fresh process: import streamlit, render the page once, report times and loaded modules
+# AppTest can't marshal the folium map component, so st_folium is replaced by a no-op right after streamlit_folium
+# is imported by the page (the import itself is still measured, only drawing the map is skipped)
+CHILD = """
+import importlib.abc, importlib.util, json, sys, time
+
+class NoMapFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        if name != "streamlit_folium":
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        exec_module = spec.loader.exec_module
+        def exec_without_map(module):
+            exec_module(module)
+            module.st_folium = lambda *args, **kwargs: None
+        spec.loader.exec_module = exec_without_map
+        return spec
+
+sys.meta_path.insert(0, NoMapFinder())
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+script, state, heavy = sys.argv[1], json.loads(sys.argv[2]), json.loads(sys.argv[3])
+at = AppTest.from_file(script, default_timeout=120)
+for key, value in state.items():
+    at.session_state[key] = value
+before = time.perf_counter()
+at.run()
+done = time.perf_counter()
+print(json.dumps({
+    "streamlit_import_ms": (imported - start) * 1000,
+    "render_ms": (done - before) * 1000,
+    "total_ms": (done - start) * 1000,
+    "exceptions": [e.message for e in at.exception],
+    "loaded_modules": [m for m in heavy if m in sys.modules],
+}))
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    # nothing listens on this port, so the result page fails fast instead of calling the real geocoding API
+    env.setdefault("NOMINATIM_URL", "http://127.0.0.1:9")
+    env.setdefault("OVERPASS_URL", "http://127.0.0.1:9/api/interpreter")
+    return env
+
+
+def measure_page(script, state):
+    output = subprocess.run([sys.executable, "-c", CHILD, script, json.dumps(state), json.dumps(HEAVY_MODULES)],
+                            cwd=ROOT, env=child_env(), capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# cold import time of every heavy module on its own
+def measure_import(module):
+    code = f"import time; start = time.perf_counter(); import {module}; print((time.perf_counter() - start) * 1000)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=child_env(), capture_output=True, text=True)
+    return float(result.stdout.strip()) if result.returncode == 0 else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold import time and time to first paint of every page.")
+    parser.add_argument("--output", default="startup_report.json", help="json report (default: startup_report.json)")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per page, the median is reported (default: 3)")
+    args = parser.parse_args()
+
+    report = {"imports_ms": {m: measure_import(m) for m in HEAVY_MODULES}, "pages": {}}
+    failed = []
+
+    for name, (script, state, budget_ms, forbidden) in PAGES.items():
+        if name == "result" and not os.path.exists(os.path.join(ROOT, "price_estimator.pkl")):
+            print(f"{name:28} skipped, train the model first")
+            continue
+        runs = [measure_page(script, state) for _ in range(args.repeat)]
+        runs.sort(key=lambda r: r["render_ms"])
+        page = runs[len(runs) // 2]
+        page["budget_ms"] = budget_ms
+        page["unexpected_modules"] = [m for m in forbidden if m in page["loaded_modules"]]
+        page["within_budget"] = page["render_ms"] <= budget_ms and not page["unexpected_modules"] and not page["exceptions"]
+        report["pages"][name] = page
+        if not page["within_budget"]:
+            failed.append(name)
+
+        print(f"{name:28} first paint {page['render_ms']:7.0f} ms (budget {budget_ms} ms), "
+              f"total {page['total_ms']:7.0f} ms, loaded: {', '.join(page['loaded_modules']) or '-'}")
+        if page["unexpected_modules"]:
+            print(f"{'':28} should not load: {', '.join(page['unexpected_modules'])}")
+        if page["exceptions"]:
+            print(f"{'':28} exceptions: {page['exceptions']}")
+
+    print("\nCold import time per module:")
+    for module, ms in report["imports_ms"].items():
+        print(f"  {module:20} {'not installed' if ms is None else f'{ms:7.0f} ms'}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to '{args.output}'")
+
+    if failed:
+        print(f"Over budget: {', '.join(failed)}")
+        sys.exit(1)
@@ -0,0 +1,157 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+# Load test of scoring_service.py
+# Concurrent clients send single apartments over keep-alive connections for a fixed time, the report contains the
+# throughput, the latency percentiles and the mean batch size of the service. Without --url the service is started
+# locally once per --max-batch value, so batching can be compared with one predict call per request.
+#
+#   python benchmarks/load_test_service.py --clients 32 --duration 20 --max-batch 1 64
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ZIP_CODES = [8001, 8004, 8032, 8048, 1201, 1205, 1209, 1004, 1006, 9000, 9008]
+
+
+def random_apartment(rng):
+    rooms = rng.choice([1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5.5])
+    return {
+        "zip_code": rng.choice(ZIP_CODES),
+        "rooms": rooms,
+        "size": int(rooms * 25 + rng.randint(-10, 20)),
+        "outdoor_space": rng.choice(["No", "Balcony", "Terrace", "Garden"]),
+        "is_renovated": rng.choice(["Yes", "No"]),
+        "parking": rng.choice(["No", "Parking Outdoor", "Garage"]),
+        "demanded_rent": rng.randint(1000, 6000),
+    }
+
+
+def client(host, port, until, seed, latencies, errors):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    while time.perf_counter() < until:
+        body = json.dumps(random_apartment(rng))
+        start = time.perf_counter()
+        try:
+            connection.request("POST", "/estimate", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(1)
+    connection.close()
+
+
+def get_json(host, port, path):
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        connection.request("GET", path)
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def run_load(host, port, clients, duration):
+    before = get_json(host, port, "/health")
+    latencies, errors = [], []
+    until = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(host, port, until, i, latencies, errors)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seconds = time.perf_counter() - start
+    after = get_json(host, port, "/health")
+
+    ms = np.array(latencies) * 1000
+    batches = after["batches"] - before["batches"]
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_s": len(latencies) / seconds,
+        "p50_ms": float(np.percentile(ms, 50)) if len(ms) else None,
+        "p95_ms": float(np.percentile(ms, 95)) if len(ms) else None,
+        "p99_ms": float(np.percentile(ms, 99)) if len(ms) else None,
+        "max_ms": float(ms.max()) if len(ms) else None,
+        "mean_batch_size": (after["rows"] - before["rows"]) / batches if batches else None,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# starts scoring_service.py and waits until it answers
+def start_service(port, max_batch, max_wait_ms):
+    process = subprocess.Popen([sys.executable, "scoring_service.py", "--port", str(port), "--max-batch", str(max_batch),
+                                "--max-wait-ms", str(max_wait_ms)], cwd=ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            get_json("127.0.0.1", port, "/health")
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("scoring_service.py could not be started")
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("scoring_service.py did not start in time")
+
+
+def print_result(label, r):
+    print(f"{label:24} {r['requests_per_s']:8.0f} req/s  p50 {r['p50_ms']:6.1f} ms  p95 {r['p95_ms']:6.1f} ms  "
+          f"p99 {r['p99_ms']:6.1f} ms  max {r['max_ms']:6.1f} ms  batch {r['mean_batch_size'] or 0:5.1f}  errors {r['errors']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and tail latency of the scoring service.")
+    parser.add_argument("--url", default=None, help="running service, e.g. http://127.0.0.1:8000 (default: start one locally)")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients (default: 32)")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per run (default: 15)")
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[1, 64], help="batch sizes of the local service (default: 1 64)")
+    parser.add_argument("--max-wait-ms", type=float, default=2, help="batch wait of the local service (default: 2)")
+    parser.add_argument("--output", default="service_load_report.json", help="json report (default: service_load_report.json)")
+    args = parser.parse_args()
+
+    report = {"clients": args.clients, "duration_s": args.duration, "runs": []}
+    if args.url:
+        url = urlparse(args.url)
+        result = run_load(url.hostname, url.port or 80, args.clients, args.duration)
+        report["runs"].append({"service": args.url, **result})
+        print_result(args.url, result)
+    else:
+        for max_batch in args.max_batch:
+            port = free_port()
+            process = start_service(port, max_batch, args.max_wait_ms)
+            try:
+                result = run_load("127.0.0.1", port, args.clients, args.duration)
+            finally:
+                process.terminate()
+                process.wait()
+            report["runs"].append({"max_batch": max_batch, "max_wait_ms": args.max_wait_ms, **result})
+            print_result(f"max batch {max_batch}", result)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to '{args.output}'")
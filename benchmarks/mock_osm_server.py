@@ -0,0 +1,83 @@
+import argparse
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for Nominatim (GET /search) and Overpass (POST /api/interpreter)
+# Every address is found at the same point in Zurich (addresses containing "nowhere" are not found), and every
+# Overpass query answers with random places around it. Single amenities can be made slow or failing, so the
+# deadlines and the partial rendering of the result page can be tried without the real APIs.
+#
+#   python benchmarks/mock_osm_server.py --port 8765 --latency-ms 300 --slow school=20 --fail hospital
+#   NOMINATIM_URL=http://127.0.0.1:8765 OVERPASS_URL=http://127.0.0.1:8765/api/interpreter streamlit run Fair_Rental_Price_Evaluator.py
+
+LAT, LON = 47.3769, 8.5417
+
+
+def random_places(count, seed=0):
+    rng = random.Random(seed)
+    return [{"type": "node", "id": i, "lat": LAT + rng.uniform(-0.02, 0.02), "lon": LON + rng.uniform(-0.02, 0.02),
+             "tags": {"name": f"Place {i}"}} for i in range(count)]
+
+
+def make_handler(latency_s, slow, fail, places):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            time.sleep(latency_s)
+            query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+            if "nowhere" in query.lower():
+                self._send(200, [])
+            else:
+                self._send(200, [{"lat": str(LAT), "lon": str(LON), "display_name": query}])
+
+        def do_POST(self):
+            query = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            # the tag value of the query, e.g. node["amenity"="school"] -> school
+            match = re.search(r'"="([^"]+)"', query)
+            category = match.group(1) if match else ""
+            time.sleep(latency_s + slow.get(category, 0))
+            if category in fail:
+                self._send(504, {"error": f"{category} failed on purpose"})
+            else:
+                self._send(200, {"elements": places})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def parse_slow(values):
+    slow = {}
+    for value in values:
+        category, seconds = value.split("=")
+        slow[category] = float(seconds)
+    return slow
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Nominatim and Overpass server for local testing.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200, help="delay of every answer (default: 200)")
+    parser.add_argument("--slow", nargs="*", default=[], help="extra delay per Overpass tag value, e.g. school=20")
+    parser.add_argument("--fail", nargs="*", default=[], help="Overpass tag values that answer with an error")
+    parser.add_argument("--places", type=int, default=300, help="places in every Overpass answer (default: 300)")
+    args = parser.parse_args()
+
+    handler = make_handler(args.latency_ms / 1000, parse_slow(args.slow), set(args.fail), random_places(args.places))
+    print(f"Mock Nominatim/Overpass on http://127.0.0.1:{args.port}")
+    ThreadingHTTPServer(("127.0.0.1", args.port), handler).serve_forever()
@@ -0,0 +1,120 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Synthetic rent listings in the same ;-separated latin1 schema as the city csv files (e.g. zurich.csv)
+# Sizes, rooms, place types, ZIP codes and the characteristics texts follow the scraped files, the rent depends on
+# the city, the size and the keywords, so the generated files can also be used to train the model. A few rows
+# are incomplete or have a price on request, like in the real exports.
+#
+#   python benchmarks/synthetic_listings.py 100000 synthetic_100k.csv
+
+COLUMNS = ['number_of_rooms', 'square_meters', 'place_type', 'street', 'zip_city', 'char.1', 'char.2', 'char.3', 'rent', 'p/squarem/y']
+
+# city -> (ZIP codes, average rent in CHF per m2 per year)
+CITIES = {
+    "Zurich": ([8001, 8002, 8003, 8004, 8005, 8006, 8008, 8032, 8037, 8044, 8045, 8047, 8048, 8050, 8051, 8055, 8057], 430),
+    "Genève": ([1201, 1202, 1203, 1204, 1205, 1206, 1207, 1208, 1209], 400),
+    "Lausanne": ([1003, 1004, 1005, 1006, 1007, 1010, 1012, 1018], 330),
+    "St. Gallen": ([9000, 9008, 9010, 9011, 9012, 9014, 9015, 9016], 240),
+}
+
+PLACE_TYPES = ["Apartment", "Furnished apartment", "Studio", "Duplex", "Penthouse", "Attic flat", "Loft", "Stepped apartment"]
+PLACE_TYPE_SHARE = [0.87, 0.04, 0.03, 0.02, 0.015, 0.01, 0.005, 0.01]
+PLACE_TYPE_FACTOR = [1.0, 1.25, 1.1, 1.05, 1.4, 1.05, 1.15, 1.05]
+
+STREETS = ["Bahnhofstrasse", "Kreuzstrasse", "Rue Du Rhône", "Route De Marin", "Chemin De Longeraie", "Multergasse",
+           "Haldenstrasse", "Seestrasse", "Avenue De France", "Rosenbergstrasse", "Dorfstrasse", "Rue De Lausanne"]
+
+# characteristics texts, with and without the keywords of features.py
+OUTDOOR_TEXTS = ["Sunny balcony space", "Private garden", "Large terrace with view", "Covered loggia", "Roof terrace"]
+RENOVATED_TEXTS = ["Modern kitchen amenities", "Newly renovated bathroom", "Luxury finishes", "Modern kitchen with dishwasher"]
+PARKING_TEXTS = ["Parking space available", "Garage included", "Underground parking"]
+PLAIN_TEXTS = ["Bright living area", "Prime city location", "Quiet neighbourhood", "Close to public transport",
+               "Spacious bedrooms", "Lift in the building", "Cellar compartment", "Pets allowed"]
+
+MISSING_SHARE = 0.02 # rows without street, size or with a price on request
+
+
+def _pick(rng, texts, count):
+    return np.asarray(texts, dtype=object)[rng.integers(0, len(texts), count)]
+
+
+# one block of synthetic listings as raw (uncleaned) text columns
+def generate_listings(count, seed=42):
+    rng = np.random.default_rng(seed)
+
+    city_names = list(CITIES)
+    city = rng.integers(0, len(city_names), count)
+    zip_code = np.empty(count, dtype=np.int64)
+    base_price = np.empty(count)
+    for i, name in enumerate(city_names):
+        zips, price = CITIES[name]
+        rows = city == i
+        zip_code[rows] = np.asarray(zips)[rng.integers(0, len(zips), rows.sum())]
+        base_price[rows] = price
+
+    rooms = np.clip(np.round(rng.gamma(4.0, 0.75, count) * 2) / 2, 1, 8)
+    size = np.clip(np.round(rooms * 24 + rng.normal(0, 12, count)), 15, 400).astype(int)
+    place = rng.choice(len(PLACE_TYPES), count, p=PLACE_TYPE_SHARE)
+
+    outdoor = rng.random(count) < 0.55
+    renovated = rng.random(count) < 0.45
+    parking = rng.random(count) < 0.2
+
+    price_m2 = (base_price * np.asarray(PLACE_TYPE_FACTOR)[place] * (1 + 0.08 * renovated + 0.04 * outdoor + 0.03 * parking)
+                * rng.lognormal(0, 0.15, count) * (1 + (zip_code % 10) / 50))
+    rent = np.round(price_m2 * size / 12 / 10) * 10
+
+    # every keyword group goes to one of the three text columns, the others get neutral texts
+    texts = np.stack([_pick(rng, PLAIN_TEXTS, count) for _ in range(3)], axis=1)
+    for flags, options in ((outdoor, OUTDOOR_TEXTS), (renovated, RENOVATED_TEXTS), (parking, PARKING_TEXTS)):
+        rows = np.flatnonzero(flags)
+        texts[rows, rng.integers(0, 3, len(rows))] = _pick(rng, options, len(rows))
+
+    room_text = np.where(rooms == 1, "1 room ", pd.Series(rooms).map(lambda r: f"{r:g} rooms ").to_numpy())
+    listings = pd.DataFrame({
+        'number_of_rooms': room_text,
+        'square_meters': [f" {s} m_ " for s in size],
+        'place_type': [f" {PLACE_TYPES[p]}" for p in place],
+        'street': [f"{s} {n}" for s, n in zip(_pick(rng, STREETS, count), rng.integers(1, 120, count))],
+        'zip_city': [f" {z} {city_names[c]}" for z, c in zip(zip_code, city)],
+        'char.1': texts[:, 0],
+        'char.2': texts[:, 1],
+        'char.3': texts[:, 2],
+        'rent': [f"CHFÊ{r:,.0f}.-" for r in rent],
+        'p/squarem/y': [f"CHFÊ{p:,.0f} / m_ / year" for p in rent * 12 / size],
+    }, columns=COLUMNS)
+
+    incomplete = rng.random(count) < MISSING_SHARE
+    gap = rng.integers(0, 3, count)
+    listings.loc[incomplete & (gap == 0), 'street'] = np.nan
+    listings.loc[incomplete & (gap == 1), 'square_meters'] = np.nan
+    listings.loc[incomplete & (gap == 2), ['rent', 'p/squarem/y']] = "Price on request"
+    return listings
+
+
+# writes count listings in blocks, so a million rows never have to be built at once
+def write_listings(path, count, seed=42, block_size=100000):
+    written = 0
+    block = 0
+    with open(path, "w", encoding="latin1", newline="") as f:
+        while written < count or block == 0:
+            rows = min(block_size, count - written)
+            generate_listings(rows, seed + block).to_csv(f, sep=";", index=False, header=block == 0)
+            written += rows
+            block += 1
+    return os.path.getsize(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic listings in the schema of the city csv files.")
+    parser.add_argument("rows", type=int, help="number of listings, e.g. 10000, 100000 or 1000000")
+    parser.add_argument("output", help="csv file to write")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (default: 42)")
+    args = parser.parse_args()
+
+    size = write_listings(args.output, args.rows, args.seed)
+    print(f"{args.rows:,} listings written to '{args.output}' ({size / 1e6:.1f} MB)")
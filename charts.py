@@ -0,0 +1,118 @@
+import io
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image, ImageDraw
+
+# Diagrams of the result page, rendered to png images
+# The figures are plain matplotlib Figure objects instead of the global pyplot state, so nothing is left open after
+# a render. The predicted vs. actual diagram doesn't change between renders except for the entered apartment: the
+# background (test listings, ideal line, axes and legend) is rendered once per model version and every render only
+# draws the red point onto a copy of that image. The test listings are downsampled to SCATTER_POINTS, so the time
+# and memory of a render don't depend on the size of the test set.
+
+DPI = 150
+FIGSIZE = (8, 6)
+SCATTER_POINTS = 500
+USER_POINT_SIZE = 100 # marker area in points², same as plt.scatter(s=100)
+
+
+# at most max_points of the (actual, predicted) pairs, always the same ones for the same data
+def downsample(actual, predicted, max_points=SCATTER_POINTS, seed=42):
+    actual = np.asarray(actual, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    if len(actual) <= max_points:
+        return actual, predicted
+    keep = np.sort(np.random.default_rng(seed).choice(len(actual), max_points, replace=False))
+    return actual[keep], predicted[keep]
+
+
+def to_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="png", compress_level=1)
+    return buffer.getvalue()
+
+
+def _figure_png(fig):
+    buffer = io.BytesIO()
+    FigureCanvasAgg(fig)
+    fig.savefig(buffer, format="png", dpi=DPI)
+    return buffer.getvalue()
+
+
+def _draw_scatter(ax, actual, predicted, actual_range):
+    actual_min, actual_max = actual_range
+    ax.scatter(actual, predicted, alpha=0.6, label='Training Data Predictions')
+    ax.plot([actual_min, actual_max], [actual_min, actual_max], 'r--', label='Ideal Prediction Line')
+    ax.set_xlabel("Actual Rent (CHF)")
+    ax.set_ylabel("Predicted Rent (CHF)")
+    ax.set_title("Predicted vs. Actual Rent Price")
+
+
+class ScatterBackground:
+
+    # the rendered diagram without the entered apartment and where its axes are in the image
+    def __init__(self, actual, predicted, actual_range):
+        self.actual, self.predicted = downsample(actual, predicted)
+        self.actual_range = actual_range
+
+        fig = Figure(figsize=FIGSIZE, dpi=DPI, layout="tight")
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        _draw_scatter(ax, self.actual, self.predicted, actual_range)
+        ax.scatter([], [], color='red', s=USER_POINT_SIZE, label='Entered Apartment') # only for the legend
+        ax.legend()
+        canvas.draw()
+
+        image = Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba(), "raw", "RGBA", 0, 1).convert("RGB")
+        # 256 colors are enough for the diagram, and a palette png is encoded about 7x faster than a full color one
+        self.image = image.quantize(256)
+        palette = np.array(self.image.getpalette()[:768]).reshape(-1, 3)
+        self.red = int(np.abs(palette - [255, 0, 0]).sum(axis=1).argmin()) # the legend has the red of the point
+        self.xlim, self.ylim = ax.get_xlim(), ax.get_ylim()
+        self.transform = ax.transData.frozen() # data -> pixels, origin at the bottom left
+        self.nbytes = self.image.width * self.image.height
+
+    def contains(self, actual, predicted):
+        return self.xlim[0] <= actual <= self.xlim[1] and self.ylim[0] <= predicted <= self.ylim[1]
+
+    # png of the diagram with the entered apartment, only the point is drawn
+    def with_point(self, actual, predicted):
+        if not self.contains(actual, predicted):
+            return scatter_png(self.actual, self.predicted, self.actual_range, actual, predicted)
+        x, y = self.transform.transform((actual, predicted))
+        y = self.image.height - y
+        radius = np.sqrt(USER_POINT_SIZE) / 2 * DPI / 72
+        image = self.image.copy()
+        ImageDraw.Draw(image).ellipse([x - radius, y - radius, x + radius, y + radius], fill=self.red)
+        return to_png(image)
+
+
+# the whole diagram in one go, for apartments outside of the axes of the cached background
+def scatter_png(actual, predicted, actual_range, user_actual, user_predicted):
+    fig = Figure(figsize=FIGSIZE, dpi=DPI, layout="tight")
+    ax = fig.add_subplot()
+    _draw_scatter(ax, actual, predicted, actual_range)
+    ax.scatter(user_actual, user_predicted, color='red', s=USER_POINT_SIZE, label='Entered Apartment')
+    ax.legend()
+    return _figure_png(fig)
+
+
+# price per m2 per year of the apartment next to the median of the ZIP code, with the middle 50% of the listings
+def market_bar_png(user_value, median, p25, p75, zip_code):
+    fig = Figure(figsize=FIGSIZE, dpi=DPI, layout="tight")
+    ax = fig.add_subplot()
+    bars = ax.bar(['Your Apartment', 'Market Median in your Area'], [user_value, median], color=["green", "blue"])
+    # middle half of the listings of the ZIP code (25th to 75th percentile)
+    ax.errorbar(1, median, yerr=[[median - p25], [p75 - median]], fmt='none', ecolor='black', capsize=12,
+                label="Middle 50% of the listings")
+    ax.set_ylabel("CHF per m² per year")
+    ax.set_title(f"Price per m²/year Comparison (ZIP {zip_code})")
+    ax.legend()
+
+    # Add value labels on bars
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2, height + 5, f"{int(height)} CHF", ha='center', va='bottom')
+    return _figure_png(fig)
@@ -0,0 +1,113 @@
+import json
+import os
+
+import joblib
+import numpy as np
+
+# Compact inference artifact of the price estimator
+# All trees of the random forest are flattened into a few arrays (one entry per node) and saved as .npy files.
+# They are memory-mapped when loaded, so every Streamlit worker shares the same pages instead of holding its
+# own copy of the pickled forest, and all trees are evaluated together with NumPy.
+
+COMPACT_DIR = "price_estimator_compact"
+
+
+# largest float32 that is <= value; the trees compare float32 features, so x <= threshold and
+# x <= floor32(threshold) give the same result for every feature value and the predictions don't change
+def _floor_float32(values):
+    rounded = values.astype(np.float32)
+    too_big = rounded.astype(np.float64) > values
+    rounded[too_big] = np.nextafter(rounded[too_big], np.float32(-np.inf))
+    return rounded
+
+
+# flattens the fitted trees of a forest into node arrays, leaves point to themselves
+def flatten_forest(forest):
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    depth = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, np.inf, _floor_float32(tree.threshold)).astype(np.float32))
+        lefts.append((np.where(is_leaf, nodes, tree.children_left) + offset).astype(np.int32))
+        rights.append((np.where(is_leaf, nodes, tree.children_right) + offset).astype(np.int32))
+        values.append(tree.value[:, 0, 0].astype(np.float32))
+        roots.append(offset)
+        offset += tree.node_count
+        depth = max(depth, tree.max_depth)
+
+    return {
+        "feature": np.concatenate(features),
+        "threshold": np.concatenate(thresholds),
+        "left": np.concatenate(lefts),
+        "right": np.concatenate(rights),
+        "value": np.concatenate(values),
+        "roots": np.array(roots, dtype=np.int32),
+    }, depth
+
+
+# calibration of the price ranges of this forest (see intervals.py), saved with the model because smaller
+# compact forests spread differently than the full one
+def export_compact(pipeline, compact_dir=COMPACT_DIR, calibration=None):
+    os.makedirs(compact_dir, exist_ok=True)
+    arrays, depth = flatten_forest(pipeline.named_steps['regressor'])
+    for name, array in arrays.items():
+        np.save(os.path.join(compact_dir, f"{name}.npy"), array)
+    joblib.dump(pipeline.named_steps['preprocessor'], os.path.join(compact_dir, "preprocessor.pkl"))
+    with open(os.path.join(compact_dir, "meta.json"), "w") as f:
+        json.dump({"trees": len(arrays["roots"]), "nodes": len(arrays["value"]), "max_depth": depth, "intervals": calibration}, f, indent=2)
+
+
+def compact_size(compact_dir=COMPACT_DIR):
+    return sum(os.path.getsize(os.path.join(compact_dir, f)) for f in os.listdir(compact_dir))
+
+
+class CompactForest:
+
+    def __init__(self, compact_dir=COMPACT_DIR):
+        def load(name):
+            return np.load(os.path.join(compact_dir, f"{name}.npy"), mmap_mode="r")
+        self.feature = load("feature")
+        self.threshold = load("threshold")
+        self.left = load("left")
+        self.right = load("right")
+        self.value = load("value")
+        self.roots = np.asarray(load("roots"))
+        self.preprocessor = joblib.load(os.path.join(compact_dir, "preprocessor.pkl"))
+        with open(os.path.join(compact_dir, "meta.json")) as f:
+            meta = json.load(f)
+        self.max_depth = meta["max_depth"]
+        self.calibration = meta.get("intervals")
+        if self.calibration is not None: # json keys are strings
+            self.calibration["levels"] = {float(level): factor for level, factor in self.calibration["levels"].items()}
+
+    @staticmethod
+    def exists(compact_dir=COMPACT_DIR):
+        return os.path.exists(os.path.join(compact_dir, "meta.json"))
+
+    # leaf value of every tree for every row, shape (rows, trees)
+    def tree_predictions(self, X):
+        Xt = np.asarray(self.preprocessor.transform(X), dtype=np.float32)
+        n_rows, n_trees = len(Xt), len(self.roots)
+        nodes = np.tile(self.roots, n_rows) # (row, tree) pairs flattened, row major
+        rows = np.repeat(np.arange(n_rows), n_trees)
+        active = np.arange(len(nodes))
+        # one step down in all trees for all rows at once, pairs that reached a leaf are dropped
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            go_left = Xt[rows[active], self.feature[current]] <= self.threshold[current]
+            following = np.where(go_left, self.left[current], self.right[current])
+            moved = following != current
+            nodes[active] = following
+            active = active[moved]
+            if not len(active):
+                break
+        return self.value[nodes].reshape(n_rows, n_trees)
+
+    # same interface as the sklearn pipeline
+    def predict(self, X):
+        return self.tree_predictions(X).mean(axis=1, dtype=np.float64)
@@ -0,0 +1,84 @@
+import joblib
+import numpy as np
+from sklearn.neighbors import KDTree
+
+# Most similar real listings of the training csv files for an apartment
+# Built by train_model_all_cities.py and saved next to the model. The listings are partitioned by ZIP code and by
+# ZIP area (first two digits), every partition has its own KD-tree over the scaled size, rooms and features,
+# so a query only searches the listings around the apartment.
+
+COMPARABLES_FILE = "comparables.pkl"
+
+# a difference of 15 m² counts as much as one room or one missing feature (outdoor space, renovated, parking)
+FEATURE_SCALES = {
+    "square_meters": 15.0,
+    "number_of_rooms": 1.0,
+    "Is_Renovated_or_New": 1.0,
+    "Has_Parking": 1.0,
+    "Has_Outdoor_Space": 1.0,
+}
+LISTING_COLUMNS = ['ZIP', 'City', 'street', 'number_of_rooms', 'square_meters', 'place_type', 'rent', 'Is_Renovated_or_New', 'Has_Parking', 'Has_Outdoor_Space']
+
+
+def zip_area(zip_code):
+    return int(zip_code) // 100 # 8001 -> 80
+
+
+def _scaled(columns):
+    # the parking of the form can be 2 (garage), the listings only know parking yes/no
+    values = dict(columns)
+    values["Has_Parking"] = np.minimum(np.asarray(values["Has_Parking"], dtype=np.float64), 1)
+    return np.column_stack([np.asarray(values[c], dtype=np.float64) / scale for c, scale in FEATURE_SCALES.items()])
+
+
+class ComparablesIndex:
+
+    def __init__(self, listings, leaf_size=16):
+        listings = listings.dropna(subset=['ZIP', 'rent', *FEATURE_SCALES])
+        # the same apartment is often listed more than once
+        listings = listings.drop_duplicates(subset=['ZIP', 'street', 'number_of_rooms', 'square_meters', 'rent'])
+        # plain arrays instead of a DataFrame, picking a few rows out of them takes microseconds
+        self.columns = {c: listings[c].to_numpy() for c in LISTING_COLUMNS}
+
+        points = _scaled(self.columns)
+        zips = self.columns['ZIP'].astype(np.int64)
+        # (level, key) -> (tree, positions of its listings)
+        self.partitions = {("all", 0): (KDTree(points, leaf_size=leaf_size), np.arange(len(points)))}
+        for level, keys in (("zip", zips), ("area", zips // 100)):
+            for key in np.unique(keys):
+                positions = np.flatnonzero(keys == key)
+                self.partitions[(level, int(key))] = (KDTree(points[positions], leaf_size=leaf_size), positions)
+
+    def __len__(self):
+        return len(self.columns['ZIP'])
+
+    # positions in self.columns and distances of the k most similar listings, and where they were searched
+    # the ZIP code is used when it has at least k listings, otherwise the ZIP area or all listings
+    def nearest(self, features, k=5):
+        point = _scaled({c: [features[c]] for c in FEATURE_SCALES})
+        zip_code = int(float(features["ZIP"])) if features["ZIP"] else 0
+        for level, key in (("zip", zip_code), ("area", zip_area(zip_code)), ("all", 0)):
+            partition = self.partitions.get((level, key))
+            if partition is not None and len(partition[1]) >= k:
+                break
+        tree, positions = partition
+        distances, found = tree.query(point, k=min(k, len(positions)))
+        return positions[found[0]], distances[0], level
+
+    # the k most similar listings as dicts with the LISTING_COLUMNS and the distance, most similar first
+    def query(self, features, k=5):
+        positions, distances, level = self.nearest(features, k)
+        comparables = [{c: values[i] for c, values in self.columns.items()} for i in positions]
+        for comparable, distance in zip(comparables, distances):
+            comparable["distance"] = float(distance)
+        return comparables, level
+
+
+def build_comparables(listings, path=COMPARABLES_FILE):
+    index = ComparablesIndex(listings)
+    joblib.dump(index, path)
+    return index
+
+
+def load_comparables(path=COMPARABLES_FILE):
+    return joblib.load(path)
@@ -0,0 +1,69 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from intervals import calibrate
+
+# Model diagnostics written by train_model_all_cities.py and shown on the result page
+# The predictions for the held-out listings are computed once at training time, so the app does not need to
+# run the whole random forest over the test set again when the page is shown.
+
+DIAGNOSTICS_FILE = "model_diagnostics.pkl"
+TRAINED_MODEL_FILE = "price_estimator.pkl" # the model the diagnostics file belongs to
+SCATTER_SAMPLE_SIZE = 500 # points of the predicted vs. actual diagram
+
+
+def residual_summary(y_test, y_pred):
+    residuals = np.asarray(y_pred, dtype=float) - np.asarray(y_test, dtype=float)
+    return {
+        "count": int(len(residuals)),
+        "rmse": float(np.sqrt(np.mean(residuals ** 2))),
+        "mae": float(np.mean(np.abs(residuals))),
+        "mean": float(np.mean(residuals)),
+        "median": float(np.median(residuals)),
+        "p10": float(np.percentile(residuals, 10)),
+        "p90": float(np.percentile(residuals, 90)),
+    }
+
+
+# everything the result page needs, the scatter sample keeps the diagram fast for large test sets
+# calibration are the factors of the price ranges on the test set (see intervals.py)
+def build_diagnostics(X_test, y_test, y, y_pred, calibration=None, sample_size=SCATTER_SAMPLE_SIZE, random_state=42):
+    scatter = pd.DataFrame({"actual": np.asarray(y_test, dtype=float), "predicted": np.asarray(y_pred, dtype=float)})
+    if len(scatter) > sample_size:
+        scatter = scatter.sample(sample_size, random_state=random_state)
+    return {
+        "X_test": X_test,
+        "y_test": y_test,
+        "y": y,
+        "y_pred": np.asarray(y_pred, dtype=float),
+        "residuals": residual_summary(y_test, y_pred),
+        "scatter": scatter.reset_index(drop=True),
+        "actual_range": (float(np.min(y_test)), float(np.max(y_test))),
+        "intervals": calibration,
+    }
+
+
+# loads the diagnostics, older files only contain (X_test, y_test, y) or no calibration and are completed with the model once
+def load_diagnostics(model, path=DIAGNOSTICS_FILE):
+    diagnostics = joblib.load(path)
+    if isinstance(diagnostics, tuple):
+        X_test, y_test, y = diagnostics
+        # written before the listings were cleaned by ingestion.py, the place types still have their leading space
+        X_test = X_test.assign(place_type=X_test['place_type'].astype('string').str.strip())
+        diagnostics = build_diagnostics(X_test, y_test, y, model.predict(X_test))
+    if diagnostics.get("intervals") is None:
+        diagnostics["intervals"] = calibrate(model, diagnostics["X_test"], diagnostics["y_test"])
+    return diagnostics
+
+
+# calibration of the price ranges of a model, the trainer saves it with the model
+# models saved before only have it in the diagnostics file, which belongs to the model the trainer saved next to it
+def load_calibration(model, model_file, path=DIAGNOSTICS_FILE):
+    if getattr(model, "calibration", None) is not None:
+        return model.calibration
+    if os.path.abspath(model_file) != os.path.abspath(TRAINED_MODEL_FILE):
+        raise ValueError(f"'{model_file}' has no calibration of its price ranges, train it again")
+    return load_diagnostics(model, path)["intervals"]
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from ingestion import REQUIRED_COLUMNS, TEXT_COLUMNS, clean_listings
+
+# Price influencing keyword detection in characteristics columns
+# Add keywords HERE to change what counts as outdoor space, renovated/new or parking
+KEYWORD_FEATURES = {
+    # Outdoor spaces
+    "Has_Outdoor_Space": ["terrace", "balcony", "garden", "patio", "loggia", "roof terrace", "outdoor"],
+    # Renovated/New
+    "Is_Renovated_or_New": ["renovated", "new", "modern", "modern kitchen", "luxury"],
+    # Parking space
+    "Has_Parking": ["parking", "garage"],
+}
+
+# features the model is trained on, in this order
+FEATURE_COLUMNS = ['ZIP', 'number_of_rooms', 'square_meters', 'place_type', 'Is_Renovated_or_New', 'Has_Parking', 'Has_Outdoor_Space']
+
+# separators can't be part of a keyword, so a keyword never matches across two columns or two rows
+COLUMN_SEPARATOR = "\n"
+ROW_SEPARATOR = "\x00"
+
+
+# adds one 0/1 column per keyword group, a row is flagged when any keyword appears in any of the text columns
+# All text is joined into one lowercased string, every keyword is searched in it with one C level scan and the
+# match positions are mapped back to their rows. This replaces one Python call per row and keyword group.
+def add_keyword_features(data, keyword_features=KEYWORD_FEATURES, text_columns=TEXT_COLUMNS):
+    text = data[text_columns[0]].astype(str)
+    for col in text_columns[1:]:
+        text = text + COLUMN_SEPARATOR + data[col].astype(str)
+
+    blob = ROW_SEPARATOR.join(text.tolist()).lower()
+    # position right after the separator of every row, used to look up the row of a match
+    row_ends = np.cumsum(text.str.len().to_numpy() + 1)
+
+    for name, keywords in keyword_features.items():
+        flags = np.zeros(len(data), dtype=int)
+        for keyword in {k.lower() for k in keywords}:
+            if COLUMN_SEPARATOR in keyword or ROW_SEPARATOR in keyword:
+                raise ValueError(f"Keyword {keyword!r} of {name} contains a separator character")
+            if not keyword:
+                flags[:] = 1 # an empty keyword is part of every text
+                break
+            starts = _find_all(blob, keyword)
+            flags[np.searchsorted(row_ends, starts, side='right')] = 1
+        data[name] = flags
+    return data
+
+
+# start positions of all (non overlapping) occurrences of keyword in blob
+def _find_all(blob, keyword):
+    starts = []
+    pos = blob.find(keyword)
+    while pos != -1:
+        starts.append(pos)
+        pos = blob.find(keyword, pos + len(keyword))
+    return np.array(starts, dtype=np.int64)
+
+
+# feature values of one apartment entered in the form of the app (or sent to scoring_service.py)
+def apartment_feature_row(zip_code, rooms, size, outdoor_space="No", is_renovated="No", parking="No"):
+    # analyse inputs from input page and prep for estimation
+    outdoor_flag = 0 if outdoor_space == "No" else 1
+    renovated_flag = 1 if is_renovated == "Yes" else 0
+    parking_flag = 0
+    if parking == "Parking Outdoor":
+        parking_flag = 1
+    elif parking == "Garage":
+        parking_flag = 2
+
+    return {
+        "ZIP": float(zip_code) if zip_code else 0.0,
+        "number_of_rooms": rooms,
+        "square_meters": size,
+        "place_type": "Apartment",
+        "Is_Renovated_or_New": renovated_flag,
+        "Has_Parking": parking_flag,
+        "Has_Outdoor_Space": outdoor_flag
+    }
+
+
+# features of one apartment entered in the form of the app
+def apartment_features(zip_code, rooms, size, outdoor_space="No", is_renovated="No", parking="No"):
+    return pd.DataFrame([apartment_feature_row(zip_code, rooms, size, outdoor_space, is_renovated, parking)])[FEATURE_COLUMNS]
+
+
+# features of raw listings in the csv schema of the city files (e.g. a scraped export)
+# returns the cleaned listings with the feature columns and a mask of the rows that can be estimated
+def listing_features(raw_listings):
+    listings = add_keyword_features(clean_listings(raw_listings))
+    required = [c for c in REQUIRED_COLUMNS if c != 'rent'] # the rent is not needed to estimate
+    complete = listings[required].notna().all(axis=1).to_numpy()
+    return listings, complete
@@ -0,0 +1,186 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+
+import requests
+
+from http_client import get_session
+
+# Geocoding shared by all pages of the app
+# Results are stored in a SQLite file keyed on the normalized address, so a known address is answered
+# without any request. New addresses go through a token bucket that only waits when the request quota
+# of Nominatim (1 request per second) is used up, and identical lookups running at the same time share one request.
+
+CACHE_FILE = "geocode_cache.sqlite"
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+USER_AGENT = "streamlit_app (cedric.frutiger@startglobal.org)" # user-agent to prevent api crashes
+NOT_FOUND_TTL = 24 * 3600 # addresses that were not found are asked again after one day
+
+# same attribute names as the geopy locations used before
+Location = namedtuple("Location", ["latitude", "longitude", "address"])
+
+
+class GeocodingError(Exception):
+    pass
+
+
+# "  Bahnhofstrasse 1 ,8001  Zürich " and "bahnhofstrasse 1, 8001 zürich" are the same address
+def normalize_address(text):
+    text = unicodedata.normalize("NFC", str(text)).casefold()
+    text = re.sub(r"\s*,\s*", ", ", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" ,")
+
+
+class TokenBucket:
+
+    def __init__(self, rate=1.0, capacity=1):
+        self.rate = rate # tokens per second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # takes one token, only sleeps when the bucket is empty
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0
+            # the token is reserved now, so concurrent callers queue up behind each other
+            self._tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+
+
+class NominatimBackend:
+
+    def __init__(self, base_url=NOMINATIM_URL, user_agent=USER_AGENT, timeout=10, session=None):
+        self.base_url = base_url.rstrip("/")
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.session = session or get_session() # pooled connections shared with the overpass requests
+
+    # Location of the best match, None if the address does not exist
+    def geocode(self, query):
+        try:
+            response = self.session.get(f"{self.base_url}/search", params={"q": query, "format": "json", "limit": 1},
+                                        headers={"User-Agent": self.user_agent}, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise GeocodingError(str(e)) from e
+        if response.status_code != 200:
+            raise GeocodingError(f"Nominatim answered with status {response.status_code}")
+        data = response.json()
+        if not data:
+            return None
+        return Location(float(data[0]["lat"]), float(data[0]["lon"]), data[0].get("display_name", query))
+
+
+class GeocodeCache:
+
+    def __init__(self, path=CACHE_FILE):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS geocode ("
+                               "key TEXT PRIMARY KEY, lat REAL, lon REAL, address TEXT, created REAL)")
+
+    # (True, location) for a known address, location is None when it was not found, (False, None) if unknown
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT lat, lon, address, created FROM geocode WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False, None
+        lat, lon, address, created = row
+        if lat is None:
+            if time.time() - created > NOT_FOUND_TTL:
+                return False, None
+            return True, None
+        return True, Location(lat, lon, address)
+
+    def put(self, key, location):
+        values = (key, None, None, None, time.time()) if location is None else \
+            (key, location.latitude, location.longitude, location.address, time.time())
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)", values)
+
+
+class _Pending:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.location = None
+
+
+class Geocoder:
+
+    def __init__(self, backend=None, cache=None, rate_limiter=None):
+        self.backend = backend or NominatimBackend()
+        self.cache = cache or GeocodeCache()
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    # Location of the address or None if it can't be found (failed requests are not cached)
+    def geocode(self, query):
+        key = normalize_address(query)
+        if not key:
+            return None
+
+        known, location = self.cache.get(key)
+        if known:
+            self.hits += 1
+            return location
+        self.misses += 1
+
+        with self._lock:
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = _Pending()
+        if not owner:
+            pending.done.wait() # someone else is already asking for this address
+            return pending.location
+
+        try:
+            self.rate_limiter.acquire()
+            pending.location = self.backend.geocode(query)
+            self.cache.put(key, pending.location)
+        except GeocodingError:
+            pending.location = None
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done.set()
+        return pending.location
+
+    # query -> location (or None) of many addresses, the same address written differently is only looked up once
+    def geocode_many(self, queries):
+        unique = {}
+        for query in queries:
+            unique.setdefault(normalize_address(query), query)
+        locations = {key: self.geocode(query) for key, query in unique.items()}
+        return {query: locations[normalize_address(query)] for query in queries}
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+# one geocoder per process, shared by all pages and sessions
+def get_geocoder():
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = Geocoder()
+        return _geocoder
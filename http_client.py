@@ -0,0 +1,25 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# One pooled HTTP session per process for the requests to Nominatim and Overpass
+# The connections stay open between requests (no new TCP/TLS handshake for every amenity), and up to POOL_SIZE
+# requests per host can run at the same time, which the result page needs when it fetches all amenities at once.
+
+POOL_SIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
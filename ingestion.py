@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+# Shared cleaning of the city csv files used by the trainer, the market price index and the app
+# Every csv is parsed once into a typed table and cached as parquet next to the csv files,
+# so only new or changed files are parsed again
+
+CACHE_DIR = ".listings_cache"
+MANIFEST_FILE = "manifest.json"
+
+TEXT_COLUMNS = ['char.1', 'char.2', 'char.3']
+REQUIRED_COLUMNS = ['ZIP', 'number_of_rooms', 'square_meters', 'place_type', 'rent']
+
+
+# mtime and size are cheap to read, the hash is only computed when they changed
+def file_signature(path):
+    stat = os.stat(path)
+    return {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+# Parsers for single columns, they accept the raw scraped text as well as already cleaned numbers
+
+# number_of_rooms; removes any room description besides the numerical value
+def parse_rooms(values):
+    return pd.to_numeric(values.astype(str).str.extract(r'(\d+(?:\.\d+)?)')[0], errors='coerce')
+
+
+# square_meters; takes just the numerical size
+def parse_square_meters(values):
+    return pd.to_numeric(values.astype(str).str.extract(r'(\d+)')[0], errors='coerce')
+
+
+# rent and p/squarem/y; only takes the price
+def parse_price(values):
+    return pd.to_numeric(values.astype(str).str.replace(r'[^\d.]', '', regex=True), errors='coerce')
+
+
+# takes out the Zip Code and the city name
+def parse_zip_city(values):
+    zip_city = values.astype(str).str.extract(r'(\d{4})\s*(.*)')
+    return pd.to_numeric(zip_city[0], errors='coerce'), zip_city[1].str.strip()
+
+
+# Parsers for the raw scraper export (see Conversion csv.py)
+
+# "4.5 rooms • 115 m² • Apartment" -> rooms, size, place type
+def parse_room_size_type(values):
+    return values.str.extract(r'(?:(\d+(?:\.\d+)?)\s*rooms?)?\s*•?\s*(\d+)\s*m²\s*•?\s*(.*)')
+
+
+# "Route De Marin 16b, 1000 Lausanne" -> street, zip_city
+def parse_street_zip(values):
+    return values.str.extract(r'^(.*),\s*(\d{4}\s+\w+.*)$')
+
+
+# turns one raw city csv into the typed listing table
+def clean_listings(df, source_file=""):
+    clean = pd.DataFrame(index=df.index)
+    zip_code, city = parse_zip_city(df['zip_city'])
+    clean['ZIP'] = zip_code.astype('float64')
+    clean['City'] = city
+    clean['number_of_rooms'] = parse_rooms(df['number_of_rooms']).astype('float64')
+    clean['square_meters'] = parse_square_meters(df['square_meters']).astype('float64')
+    clean['place_type'] = df['place_type'].astype('string').str.strip()
+    clean['street'] = df['street'].astype('string')
+    clean['zip_city'] = df['zip_city'].astype('string')
+    for col in TEXT_COLUMNS:
+        clean[col] = df[col].astype('string')
+    clean['rent'] = parse_price(df['rent']).astype('float64')
+    clean['p/squarem/y'] = parse_price(df['p/squarem/y']).astype('float64')
+    clean['source_file'] = source_file
+    return clean.reset_index(drop=True)
+
+
+def read_city_file(filename):
+    return pd.read_csv(filename, encoding="latin1", sep=";")
+
+
+# files with the same name in different folders get their own cache file
+def _cache_path(filename, cache_dir):
+    path_hash = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{os.path.basename(filename)}-{path_hash}.parquet")
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache_dir, manifest):
+    with open(os.path.join(cache_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+# loads the cleaned listings of one file, the csv is only parsed when it is new or changed
+def load_city_listings(filename, cache_dir=CACHE_DIR, manifest=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = _read_manifest(cache_dir)
+
+    cache_file = _cache_path(filename, cache_dir)
+    signature = file_signature(filename)
+    entry = manifest.get(filename)
+
+    if entry is not None and entry.get("cache") == os.path.basename(cache_file) and os.path.exists(cache_file):
+        if entry["signature"] == signature:
+            return pd.read_parquet(cache_file)
+        # touched but not edited files (e.g. after a git checkout) keep their cache
+        if entry["hash"] == file_hash(filename):
+            entry["signature"] = signature
+            if own_manifest:
+                _write_manifest(cache_dir, manifest)
+            return pd.read_parquet(cache_file)
+
+    listings = clean_listings(read_city_file(filename), source_file=filename)
+    listings.to_parquet(cache_file, index=False)
+    manifest[filename] = {"signature": signature, "hash": file_hash(filename), "cache": os.path.basename(cache_file)}
+    if own_manifest:
+        _write_manifest(cache_dir, manifest)
+    return listings
+
+
+# loads and merges the cleaned listings of all given csv files
+def load_listings(filenames, cache_dir=CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = _read_manifest(cache_dir)
+    frames = [load_city_listings(f, cache_dir, manifest) for f in filenames if os.path.exists(f)]
+    _write_manifest(cache_dir, manifest)
+    if not frames:
+        return clean_listings(pd.DataFrame(columns=['zip_city', 'number_of_rooms', 'square_meters', 'place_type',
+                                                    'street', *TEXT_COLUMNS, 'rent', 'p/squarem/y']))
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,68 @@
+import weakref
+
+import numpy as np
+
+# Price ranges from the spread of the trees of the random forest instead of a fixed ±10%
+# The features are transformed once and all trees are evaluated in one batched pass (forest.apply, or the node
+# arrays of the compact model), which costs about as much as predict and gives the estimate (mean of the trees)
+# and how much the trees disagree (std) for every row. The spread is calibrated on the held-out listings
+# (split conformal): for every level the factor q is the share of test listings whose error is at most
+# q * spread, so e.g. the 80% range contains the real rent of 80% of the listings the model hasn't seen.
+
+LEVELS = [0.5, 0.8, 0.9]
+DEFAULT_LEVEL = 0.8
+MIN_SPREAD = 1.0 # CHF, rows where all trees agree still get a range
+MIN_CALIBRATION_ROWS = 20 # fewer test listings can't tell the 80% from the 90% range
+
+_leaf_values = weakref.WeakKeyDictionary() # fitted forest -> (values of all nodes of all trees, first node of every tree)
+
+
+def _forest_leaf_values(forest):
+    # a warm start adds trees to the same forest, then the table is built again
+    if forest not in _leaf_values or len(_leaf_values[forest][1]) != len(forest.estimators_):
+        values = [estimator.tree_.value[:, 0, 0] for estimator in forest.estimators_]
+        offsets = np.cumsum([0] + [len(v) for v in values[:-1]])
+        _leaf_values[forest] = (np.concatenate(values), offsets)
+    return _leaf_values[forest]
+
+
+# prediction of every tree for every row, shape (rows, trees)
+def tree_predictions(model, X):
+    if hasattr(model, "tree_predictions"):
+        return model.tree_predictions(X) # compact model
+    forest = model.named_steps['regressor']
+    values, offsets = _forest_leaf_values(forest)
+    leaves = forest.apply(model.named_steps['preprocessor'].transform(X)) # leaf of every tree, (rows, trees)
+    return values[leaves + offsets]
+
+
+# estimate (same as predict) and spread of the trees for every row
+def estimate_with_spread(model, X):
+    predictions = tree_predictions(model, X)
+    return predictions.mean(axis=1, dtype=np.float64), np.maximum(predictions.std(axis=1, dtype=np.float64), MIN_SPREAD)
+
+
+# calibration factors of the model on held-out listings: {"levels": {level: factor}, "rows": n}
+def calibrate(model, X_test, y_test, levels=LEVELS):
+    estimate, spread = estimate_with_spread(model, X_test)
+    scores = np.sort(np.abs(np.asarray(y_test, dtype=np.float64) - estimate) / spread)
+    n = len(scores)
+    factors = {}
+    for level in levels:
+        # the usual finite sample correction, the (n + 1) * level smallest score
+        rank = min(int(np.ceil((n + 1) * level)), n) - 1
+        factors[level] = float(scores[rank])
+    return {"levels": factors, "rows": n}
+
+
+# (estimate, lower, upper) arrays, the range contains the real rent with probability level
+def predict_interval(model, X, calibration, level=DEFAULT_LEVEL):
+    estimate, spread = estimate_with_spread(model, X)
+    factor = calibration["levels"][level]
+    return estimate, np.maximum(estimate - factor * spread, 0.0), estimate + factor * spread
+
+
+# share of the rents that are inside their range
+def coverage(y, lower, upper):
+    y = np.asarray(y, dtype=np.float64)
+    return float(np.mean((y >= lower) & (y <= upper)))
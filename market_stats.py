@@ -0,0 +1,175 @@
+import argparse
+import os
+
+import joblib
+import numpy as np
+
+from ingestion import file_hash, file_signature, load_listings
+from quantile_sketch import QuantileSketch
+
+# Incremental market price index per ZIP code
+# For every source (city csv file or added listing batch) and ZIP code the store keeps the count, sum and a mergeable
+# quantile sketch of the price per m2 per year and of the rent. Only new or changed csv files are read, listing
+# batches are folded in without reading anything else, and the sketches of all sources are merged into the
+# statistics per ZIP code and per city (median and percentiles instead of only the mean).
+#
+#   python market_stats.py                      # update the store from the city csv files
+#   python market_stats.py --add new_listings.csv  # fold in a batch of new listings (city csv schema)
+
+# Add file names HERE to include them in the market price comparison
+city_files = {
+    "Geneva": "geneve.csv",
+    "Lausanne": "lausanne.csv",
+    "Zurich": "zurich.csv",
+    "St. Gallen": "st.gallen.csv"
+}
+
+STATS_FILE = "market_stats.pkl"
+STORE_VERSION = 2
+PERCENTILES = [0.1, 0.25, 0.75, 0.9]
+BATCH_PREFIX = "batch:" # sources that were added with --add and are not csv files of city_files
+MEASURES = {"price_m2_year": "p/squarem/y", "rent": "rent"}
+
+
+# hashable snapshot of all source files, changes whenever a csv is added, removed or edited
+def source_signatures(files=None):
+    filenames = [f for f in (files or city_files.values()) if os.path.exists(f)]
+    return tuple((f, os.stat(f).st_mtime_ns, os.stat(f).st_size) for f in filenames)
+
+
+# sketches per ZIP code of a table of cleaned listings: zip -> {"city", "price_m2_year", "rent"}
+def sketch_listings(listings):
+    listings = listings.dropna(subset=['ZIP'])
+    zips = {}
+    for zip_code, group in listings.groupby('ZIP'):
+        cities = group['City'].dropna()
+        zips[int(zip_code)] = {
+            "city": str(cities.mode().iloc[0]) if len(cities) else "",
+            **{name: QuantileSketch().add(group[column].to_numpy(dtype=np.float64, na_value=np.nan))
+               for name, column in MEASURES.items()},
+        }
+    return zips
+
+
+def _merge_zips(target, zips):
+    for zip_code, entry in zips.items():
+        if zip_code not in target:
+            target[zip_code] = {"city": entry["city"], **{name: entry[name].copy() for name in MEASURES}}
+        else:
+            for name in MEASURES:
+                target[zip_code][name].merge(entry[name])
+    return target
+
+
+# count, mean, median and percentiles of one sketch
+def summarize(sketch, prefix=""):
+    summary = {f"{prefix}count": sketch.count, f"{prefix}mean": round(sketch.mean, 2), f"{prefix}median": round(sketch.quantile(0.5), 2)}
+    for q in PERCENTILES:
+        summary[f"{prefix}p{int(q * 100)}"] = round(sketch.quantile(q), 2)
+    return summary
+
+
+# price per m2 per year (count, mean, median, p10, p25, p75, p90) and the same for the rent (rent_...) per ZIP code
+def zip_stats(store):
+    merged = {}
+    for source in store["sources"].values():
+        _merge_zips(merged, source["zips"])
+    return {zip_code: {"city": entry["city"], **summarize(entry["price_m2_year"]), **summarize(entry["rent"], "rent_")}
+            for zip_code, entry in sorted(merged.items()) if entry["price_m2_year"].count}
+
+
+# the same statistics per city, the sketches of all ZIP codes of a city are merged
+def city_stats(store):
+    cities = {}
+    for source in store["sources"].values():
+        for entry in source["zips"].values():
+            city = cities.setdefault(entry["city"], {name: QuantileSketch() for name in MEASURES})
+            for name in MEASURES:
+                city[name].merge(entry[name])
+    return {city: {**summarize(entry["price_m2_year"]), **summarize(entry["rent"], "rent_")}
+            for city, entry in sorted(cities.items()) if entry["price_m2_year"].count}
+
+
+def build_market_stats(filenames):
+    store = {"version": STORE_VERSION, "sources": {f: {"zips": sketch_listings(load_listings([f]))} for f in filenames}}
+    return zip_stats(store)
+
+
+def _read_store(stats_file):
+    if os.path.exists(stats_file):
+        try:
+            store = joblib.load(stats_file)
+            if isinstance(store, dict) and store.get("version") == STORE_VERSION:
+                return store
+        except Exception:
+            pass # broken index, just rebuild it
+    return {"version": STORE_VERSION, "sources": {}}
+
+
+def _save_store(store, stats_file):
+    store["stats"] = zip_stats(store)
+    store["city_stats"] = city_stats(store)
+    joblib.dump(store, stats_file)
+
+
+# updates the store: only csv files that are new or changed are read, removed files are dropped
+# batches that were added with add_listings() are kept
+def update_market_store(files=None, stats_file=STATS_FILE):
+    filenames = [f for f in (files or city_files.values()) if os.path.exists(f)]
+    store = _read_store(stats_file)
+    changed = "stats" not in store
+
+    for name in list(store["sources"]):
+        if not name.startswith(BATCH_PREFIX) and name not in filenames:
+            del store["sources"][name]
+            changed = True
+
+    for f in filenames:
+        signature = file_signature(f)
+        source = store["sources"].get(f)
+        if source is not None and source["signature"] == signature:
+            continue
+        digest = file_hash(f)
+        # touched but not edited files (e.g. after a git checkout) keep their sketches
+        if source is None or source["hash"] != digest:
+            source = {"zips": sketch_listings(load_listings([f]))}
+        store["sources"][f] = {**source, "signature": signature, "hash": digest}
+        changed = True
+
+    if changed:
+        _save_store(store, stats_file)
+    return store
+
+
+# folds a batch of new listings (csv in the schema of the city files) into the store without reading anything else
+def add_listings(filename, stats_file=STATS_FILE):
+    store = update_market_store(stats_file=stats_file)
+    digest = file_hash(filename)
+    key = f"{BATCH_PREFIX}{os.path.basename(filename)}:{digest[:12]}"
+    if key in store["sources"]:
+        return store, 0 # this batch was already added
+    zips = sketch_listings(load_listings([filename]))
+    store["sources"][key] = {"zips": zips}
+    _save_store(store, stats_file)
+    return store, sum(entry["price_m2_year"].count for entry in zips.values())
+
+
+# statistics per ZIP code, see zip_stats()
+def load_market_stats(files=None, stats_file=STATS_FILE):
+    return update_market_store(files, stats_file)["stats"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the market price index per ZIP code.")
+    parser.add_argument("--add", nargs="*", default=[], help="csv files with new listings to fold into the index")
+    args = parser.parse_args()
+
+    for batch in args.add:
+        _, added = add_listings(batch)
+        print(f"Added {added} listings with a price of '{batch}'" if added else f"'{batch}' was already added")
+
+    store = update_market_store()
+    print(f"Market stats for {len(store['stats'])} ZIP codes and {len(store['city_stats'])} cities saved to '{STATS_FILE}'")
+    for city, entry in store["city_stats"].items():
+        print(f"  {city:12} {entry['count']:6} listings, median CHF {entry['median']:,.0f} per m² per year "
+              f"(p25 {entry['p25']:,.0f}, p75 {entry['p75']:,.0f})")
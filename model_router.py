@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import joblib
+
+# Picks the price estimator for a ZIP code: one model per ZIP region (shard) or the unified model
+# The shards are trained with "train_model_all_cities.py --shards" and saved in SHARD_DIR. They are only loaded when
+# a ZIP code of their region is estimated, and at most max_loaded shards stay in memory (least recently used are
+# dropped). ZIP codes without a shard, or whose shard was less accurate than the unified model, use the unified model.
+
+SHARD_DIR = "model_shards"
+MANIFEST_FILE = "manifest.json"
+MAX_LOADED_SHARDS = int(os.environ.get("MODEL_SHARDS_IN_MEMORY", 2))
+
+
+# ZIP region of a shard, the first two digits: 8001 -> 80 (Zurich), 1201 -> 12 (Geneva)
+def shard_key(zip_code):
+    return int(float(zip_code)) // 100
+
+
+def _shard_key_or_none(zip_code):
+    try:
+        return shard_key(zip_code)
+    except (TypeError, ValueError):
+        return None
+
+
+def shard_file(key):
+    return f"shard_{key}.pkl"
+
+
+def read_manifest(shard_dir=SHARD_DIR):
+    with open(os.path.join(shard_dir, MANIFEST_FILE)) as f:
+        manifest = {int(key): entry for key, entry in json.load(f).items()}
+    for entry in manifest.values():
+        if entry.get("intervals") is not None: # json keys are strings
+            entry["intervals"]["levels"] = {float(level): factor for level, factor in entry["intervals"]["levels"].items()}
+    return manifest
+
+
+def write_manifest(manifest, shard_dir=SHARD_DIR):
+    with open(os.path.join(shard_dir, MANIFEST_FILE), "w") as f:
+        json.dump({str(key): entry for key, entry in sorted(manifest.items())}, f, indent=2)
+
+
+class ModelRouter:
+
+    def __init__(self, load_unified, shard_dir=SHARD_DIR, max_loaded=MAX_LOADED_SHARDS):
+        self.load_unified = load_unified
+        self.shard_dir = shard_dir
+        self.max_loaded = max_loaded
+        self.manifest = read_manifest(shard_dir)
+        self._loaded = OrderedDict() # shard key -> model, least recently used first
+        self._unified = None
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    @staticmethod
+    def exists(shard_dir=SHARD_DIR):
+        return os.path.exists(os.path.join(shard_dir, MANIFEST_FILE))
+
+    def stats(self):
+        return {"loaded_shards": list(self._loaded), "loads": self.loads, "evictions": self.evictions,
+                "unified_loaded": self._unified is not None}
+
+    def _unified_model(self):
+        if self._unified is None:
+            self._unified = self.load_unified()
+        return self._unified
+
+    # (model, name of the model, calibration of its price ranges) for a ZIP code
+    # the calibration is None for the unified model and for shards with too few test listings, they use the
+    # calibration of the unified model
+    def model_for(self, zip_code):
+        entry = self.manifest.get(_shard_key_or_none(zip_code))
+        with self._lock:
+            if entry is None or not entry["routed"]:
+                return self._unified_model(), "unified", None
+            key = _shard_key_or_none(zip_code)
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key], entry["name"], entry.get("intervals")
+
+            model = joblib.load(os.path.join(self.shard_dir, entry["file"]))
+            self.loads += 1
+            self._loaded[key] = model
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+                self.evictions += 1
+            return model, entry["name"], entry.get("intervals")
+
+
+# accuracy of every shard against the unified model on the same test listings
+def accuracy_report(shard_dir=SHARD_DIR):
+    lines = [f"{'shard':10} {'ZIP':6} {'train':>6} {'test':>5} {'shard RMSE':>11} {'unified RMSE':>13} {'MB':>6}  routed"]
+    for key, entry in sorted(read_manifest(shard_dir).items()):
+        shard_rmse = "-" if entry["rmse"] is None else f"{entry['rmse']:,.0f}"
+        unified_rmse = "-" if entry["unified_rmse"] is None else f"{entry['unified_rmse']:,.0f}"
+        lines.append(f"{entry['name']:10} {key:02d}xx {entry['train_rows']:6} {entry['test_rows']:5} {shard_rmse:>11} "
+                     f"{unified_rmse:>13} {entry['size_mb']:6.1f}  {'yes' if entry['routed'] else 'no'}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(accuracy_report(sys.argv[1] if len(sys.argv) > 1 else SHARD_DIR))
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Location and amenity requests of the result page, run concurrently in a thread pool
+# The address is geocoded as soon as the page starts rendering (while the model estimates the price) and every
+# selected amenity is requested right after the location is known, all at the same time and each only once.
+# Every request has to finish before the deadline of the render, the page then shows what arrived and names
+# what failed or took too long. Requests that are too late keep running and still fill the caches for the next render.
+
+LOOKUP_DEADLINE_S = float(os.environ.get("LOOKUP_DEADLINE_S", 15))
+
+
+class NearbyLookup:
+
+    # geocode() -> (lat, lon), fetch(amenity, lat, lon, radius, timeout) -> elements
+    # nothing in here may call streamlit, the functions run in the threads of the executor
+    def __init__(self, executor, geocode, fetch, amenities, radius, deadline_s=LOOKUP_DEADLINE_S):
+        self.executor = executor
+        self.fetch = fetch
+        self.amenities = list(dict.fromkeys(amenities)) # every amenity is requested once
+        self.radius = radius
+        self.deadline = time.monotonic() + deadline_s
+        self.errors = {} # "location" or amenity -> reason, filled by location() and elements()
+        self.timings = {} # stage -> (start, end) in time.perf_counter() of the requests that finished
+        self._amenity_futures = {}
+        self._submitted = threading.Event()
+        self._location = executor.submit(self._timed, "get_location", geocode)
+        self._location.add_done_callback(self._fetch_amenities)
+
+    def _remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def _timed(self, stage, function, *args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.timings[stage] = (start, time.perf_counter())
+
+    # runs as soon as the location is known, the request timeout is what is left of the deadline
+    def _fetch_amenities(self, future):
+        try:
+            lat, lon = future.result()
+            if lat and lon:
+                for amenity in self.amenities:
+                    self._amenity_futures[amenity] = self.executor.submit(
+                        self._timed, f"amenities: {amenity}", self.fetch, amenity, lat, lon, self.radius, max(self._remaining(), 0.1))
+        except Exception:
+            pass # reported by location()
+        finally:
+            self._submitted.set()
+
+    # (lat, lon) of the address, (None, None) when it was not found, failed or missed the deadline
+    def location(self):
+        try:
+            return self._location.result(timeout=self._remaining())
+        except FutureTimeoutError:
+            self.errors["location"] = "timed out"
+        except Exception as e:
+            self.errors["location"] = str(e)
+        return None, None
+
+    # amenity -> elements of every amenity that arrived before the deadline, the others are in self.errors
+    def elements(self):
+        lat, lon = self.location()
+        if not (lat and lon):
+            return {}
+        self._submitted.wait(self._remaining())
+        result = {}
+        for amenity in self.amenities:
+            future = self._amenity_futures.get(amenity)
+            try:
+                if future is None:
+                    raise FutureTimeoutError()
+                result[amenity] = future.result(timeout=self._remaining())
+            except FutureTimeoutError:
+                self.errors[amenity] = "timed out"
+            except Exception as e:
+                self.errors[amenity] = str(e)
+        return result
@@ -0,0 +1,32 @@
+import os
+
+from amenity_index import TAG_MAPPING
+from http_client import get_session
+
+# Amenity searches on the Overpass API
+# OVERPASS_URL can point to another Overpass instance, e.g. a local mock server for testing
+# (see benchmarks/mock_osm_server.py)
+
+OVERPASS_URL = os.environ.get("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+OVERPASS_TIMEOUT = 30 # seconds
+
+
+def build_query(category, lat, lon, radius):
+    # fallback for not found amenities
+    tag_key, tag_value = TAG_MAPPING.get(category, ("amenity", category))
+    return f"""
+    [out:json];
+    (
+      node["{tag_key}"="{tag_value}"](around:{radius},{lat},{lon});
+      way["{tag_key}"="{tag_value}"](around:{radius},{lat},{lon});
+      relation["{tag_key}"="{tag_value}"](around:{radius},{lat},{lon});
+    );
+    out center;
+    """
+
+
+# elements of a category within radius meters of lat/lon, raises the requests errors (connection, timeout, status)
+def query_overpass(category, lat, lon, radius, timeout=OVERPASS_TIMEOUT):
+    response = get_session().post(OVERPASS_URL, data=build_query(category, lat, lon, radius), timeout=timeout)
+    response.raise_for_status()
+    return response.json().get("elements", [])
@@ -1,10 +1,6 @@
 import streamlit as st
-import requests #will enable http request for the map api
-#since we use a overpass turbo api, we can use https://geopy.readthedocs.io/en/stable/
-from geopy.geocoders import Nominatim #Nominatim since we are using openstreetmap api
-from geopy.distance import geodesic #we need geodesic to calculate the distance on the map we will deploy using the basic radius method
-import folium #enable the creation of a map in separate html file
 import streamlit.components.v1 as components #to be able to create a custom compenent, here our display map https://docs.streamlit.io/develop/concepts/custom-components/intro
+#the map and geocoding modules are only imported when the button is pressed, so the page itself renders fast
 
 #set page title using https://docs.streamlit.io/ examples
 st.set_page_config(page_title='Specific Amenities Finder', layout='centered')
@@ -13,6 +9,13 @@ st.title('Specific Amenities :red[Finder]')
 #storing follow up infos in the map
 if "map_html" not in st.session_state:
     st.session_state.map_html = None
+if "matrix_map_html" not in st.session_state:
+    st.session_state.matrix_map_html = None
+if "distance_table" not in st.session_state:
+    st.session_state.distance_table = None
+
+MAX_ADDRESSES = 20 #per list, new addresses are geocoded with 1 request per second
+MAX_LINES = 30 #distance lines drawn on the batch map
 
 #adress input section using https://docs.streamlit.io/ examples
 st.header('Enter Your Address')
@@ -31,7 +34,10 @@ compare_zip_code = st.text_input('Specific ZIP Code')
 compare_city = st.text_input('Specific City')
 
 if st.button('Compare Distance'):
-    geolocator = Nominatim(user_agent='streamlit_app') #creating geocoder from geopy https://geopy.readthedocs.io/en/stable/index.html?highlight=user_agent
+    import folium #enable the creation of a map in separate html file
+    from distances import haversine_m #vectorized distance on the map (same as the main page), see distances.py for the accuracy
+    from geocoding import get_geocoder #shared geocoding cache with the main page, uses nominatim from openstreetmap
+    geolocator = get_geocoder() #cached and rate limited geocoder, known addresses don't need a request
     full_address = f"{street} {house_number}, {zip_code} {city}" #Combines the address components the user entered into one full string
     location = geolocator.geocode(full_address)
 
@@ -56,7 +62,7 @@ if st.button('Compare Distance'):
             if compare_location:
                 compare_lat = compare_location.latitude
                 compare_lon = compare_location.longitude
-                dist_to_compare = geodesic((lat, lon), (compare_lat, compare_lon)).meters
+                dist_to_compare = haversine_m(lat, lon, [compare_lat], [compare_lon])[0]
 
                 folium.Marker(
                     [compare_lat, compare_lon],
@@ -80,3 +86,76 @@ if st.button('Compare Distance'):
 if st.session_state.map_html:
     st.subheader('Distance to Spesific Amenity')
     components.html(st.session_state.map_html, height=500)
+
+#Batch mode: several apartments against several locations at once
+#every address is only geocoded once (and not at all when it is in the shared cache), the distances of all pairs are computed in one numpy call
+st.header('Compare Several Apartments and Locations')
+st.write('Enter one address per line, e.g. "Bahnhofstrasse 1, 8001 Zürich". Every apartment is compared to every location.')
+homes_text = st.text_area('Apartments')
+destinations_text = st.text_area('Locations (work, university, school, ...)')
+
+#one address per line, the same address written differently (case, spaces) is only kept once
+def unique_addresses(text):
+    from geocoding import normalize_address
+    addresses = {}
+    for line in text.splitlines():
+        if line.strip():
+            addresses.setdefault(normalize_address(line), line.strip())
+    return list(addresses.values())
+
+if st.button('Compare All'):
+    import folium
+    from distances import distance_matrix_m
+    from geocoding import get_geocoder
+    import pandas as pd
+    homes = unique_addresses(homes_text)
+    destinations = unique_addresses(destinations_text)
+    dropped = homes[MAX_ADDRESSES:] + destinations[MAX_ADDRESSES:]
+    if dropped:
+        st.warning(f'Only the first {MAX_ADDRESSES} addresses of each list are compared, these were left out: ' + '; '.join(dropped))
+    homes, destinations = homes[:MAX_ADDRESSES], destinations[:MAX_ADDRESSES]
+
+    if not homes or not destinations:
+        st.error('Please enter at least one apartment and one location.')
+        st.session_state.matrix_map_html = None
+        st.session_state.distance_table = None
+    else:
+        with st.spinner('Looking up the addresses...'):
+            locations = get_geocoder().geocode_many(homes + destinations)
+        not_found = [a for a in homes + destinations if locations[a] is None]
+        if not_found:
+            st.warning('These addresses could not be found: ' + '; '.join(not_found))
+        homes = [a for a in homes if locations[a] is not None]
+        destinations = [a for a in destinations if locations[a] is not None]
+
+        if homes and destinations:
+            matrix = distance_matrix_m([locations[a].latitude for a in homes], [locations[a].longitude for a in homes],
+                                       [locations[a].latitude for a in destinations], [locations[a].longitude for a in destinations])
+            #one row per apartment, one column per location, the table can be sorted by clicking on a column
+            table = pd.DataFrame(matrix.round().astype(int), index=pd.Index(homes, name='Apartment'), columns=destinations)
+            table['Average (m)'] = matrix.mean(axis=1).round().astype(int)
+            st.session_state.distance_table = table.sort_values('Average (m)')
+
+            folium_map = folium.Map()
+            for a in homes:
+                folium.Marker([locations[a].latitude, locations[a].longitude], tooltip=a, icon=folium.Icon(color='blue', icon='home')).add_to(folium_map)
+            for a in destinations:
+                folium.Marker([locations[a].latitude, locations[a].longitude], tooltip=a, icon=folium.Icon(color='red', icon='info-sign')).add_to(folium_map)
+            if matrix.size <= MAX_LINES: #more lines would only clutter the map
+                for i, home in enumerate(homes):
+                    for j, destination in enumerate(destinations):
+                        folium.PolyLine(locations=[(locations[home].latitude, locations[home].longitude), (locations[destination].latitude, locations[destination].longitude)],
+                                        color='red', weight=1.5, opacity=0.6, tooltip=f'{matrix[i, j]:.0f} m').add_to(folium_map)
+            lats = [locations[a].latitude for a in homes + destinations]
+            lons = [locations[a].longitude for a in homes + destinations]
+            folium_map.fit_bounds([[min(lats), min(lons)], [max(lats), max(lons)]])
+            st.session_state.matrix_map_html = folium_map._repr_html_()
+        else:
+            st.session_state.matrix_map_html = None
+            st.session_state.distance_table = None
+
+if st.session_state.distance_table is not None:
+    st.subheader('Distances in Meters')
+    st.dataframe(st.session_state.distance_table, use_container_width=True)
+if st.session_state.matrix_map_html:
+    components.html(st.session_state.matrix_map_html, height=500)
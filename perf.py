@@ -0,0 +1,147 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Timing spans of one page render and the cache hits/misses during it
+# Every render of the result page gets a RenderTrace. The spans are shown in the debug panel of the page and,
+# when PERF_LOG / PERF_METRICS are set, appended as one json line per render and aggregated into a
+# Prometheus text file (histograms per stage), which can be used for p50/p95 latency dashboards.
+#
+#   PERF_LOG=perf_log.jsonl PERF_METRICS=perf_metrics.prom streamlit run Fair_Rental_Price_Evaluator.py
+#   python perf.py perf_log.jsonl   # p50/p95 per stage of all logged renders
+
+PERF_LOG = os.environ.get("PERF_LOG")
+PERF_METRICS = os.environ.get("PERF_METRICS")
+METRIC_PREFIX = "rent_app"
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0] # seconds
+
+_lock = threading.Lock()
+_histograms = {} # (page, stage) -> [count per bucket, sum, count], shared by all sessions of this process
+_cache_totals = {} # cache -> {"hits": n, "misses": n}
+
+
+class RenderTrace:
+
+    def __init__(self, page, session=None):
+        self.page = page
+        self.session = session
+        self.spans = []
+        self.caches = {}
+        self._stats_functions = {}
+        self._start = time.perf_counter()
+
+    # times the code inside the with block, stages with the same name are reported separately
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.spans.append({"name": name, "start_ms": (start - self._start) * 1000, "duration_ms": (end - start) * 1000})
+
+    # span of work that ran in another thread, start and end are time.perf_counter() values
+    def add_span(self, name, start, end):
+        self.spans.append({"name": name, "start_ms": (start - self._start) * 1000, "duration_ms": (end - start) * 1000})
+
+    # remembers the current hits/misses of a cache, finish() reports what changed during the render
+    def track_cache(self, name, stats):
+        self._stats_functions[name] = (stats, dict(stats()))
+
+    def finish(self):
+        total_ms = (time.perf_counter() - self._start) * 1000
+        for name, (stats, before) in self._stats_functions.items():
+            after = stats()
+            self.caches[name] = {k: after.get(k, 0) - before.get(k, 0) for k in ("hits", "misses")}
+        record = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "page": self.page,
+            "session": self.session,
+            "total_ms": total_ms,
+            "spans": self.spans,
+            "caches": self.caches,
+        }
+        _record(record)
+        return record
+
+
+def _observe(page, stage, seconds):
+    counts, total, count = _histograms.get((page, stage), ([0] * len(BUCKETS), 0.0, 0))
+    counts = [c + (seconds <= le) for c, le in zip(counts, BUCKETS)]
+    _histograms[(page, stage)] = (counts, total + seconds, count + 1)
+
+
+def _record(record):
+    with _lock:
+        _observe(record["page"], "total", record["total_ms"] / 1000)
+        for span in record["spans"]:
+            _observe(record["page"], span["name"], span["duration_ms"] / 1000)
+        for name, counts in record["caches"].items():
+            totals = _cache_totals.setdefault(name, {"hits": 0, "misses": 0})
+            for key, value in counts.items():
+                totals[key] += value
+
+        if PERF_LOG:
+            with open(PERF_LOG, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        if PERF_METRICS:
+            # written to a temporary file first, so a scraper never reads half a file
+            with open(PERF_METRICS + ".tmp", "w") as f:
+                f.write(prometheus_text())
+            os.replace(PERF_METRICS + ".tmp", PERF_METRICS)
+
+
+# all stage histograms and cache counters of this process in the Prometheus text format
+def prometheus_text():
+    lines = [f"# HELP {METRIC_PREFIX}_stage_seconds Duration of one stage of a page render.",
+             f"# TYPE {METRIC_PREFIX}_stage_seconds histogram"]
+    for (page, stage), (counts, total, count) in sorted(_histograms.items()):
+        labels = f'page="{page}",stage="{stage}"'
+        for le, c in zip(BUCKETS, counts):
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{{labels},le="{le}"}} {c}')
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"{METRIC_PREFIX}_stage_seconds_sum{{{labels}}} {total:.6f}")
+        lines.append(f"{METRIC_PREFIX}_stage_seconds_count{{{labels}}} {count}")
+    for kind in ("hits", "misses"):
+        lines.append(f"# TYPE {METRIC_PREFIX}_cache_{kind}_total counter")
+        for name, totals in sorted(_cache_totals.items()):
+            lines.append(f'{METRIC_PREFIX}_cache_{kind}_total{{cache="{name}"}} {totals[kind]}')
+    return "\n".join(lines) + "\n"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    position = (len(values) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+# p50/p95 in ms per stage over all renders of a PERF_LOG file
+def summarize_log(path):
+    durations = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            durations.setdefault((record["page"], "total"), []).append(record["total_ms"])
+            for span in record["spans"]:
+                durations.setdefault((record["page"], span["name"]), []).append(span["duration_ms"])
+    return {key: {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+            for key, values in durations.items()}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python perf.py perf_log.jsonl")
+        sys.exit(2)
+    summary = summarize_log(sys.argv[1])
+    print(f"{'page':10} {'stage':30} {'renders':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for (page, stage), entry in sorted(summary.items(), key=lambda item: -item[1]["p95"]):
+        print(f"{page:10} {stage:30} {entry['count']:8} {entry['p50']:9.1f} {entry['p95']:9.1f}")
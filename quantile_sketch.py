@@ -0,0 +1,87 @@
+import math
+
+import numpy as np
+
+# Mergeable quantile sketch for prices (DDSketch: logarithmic buckets with a fixed relative accuracy)
+# Every value is counted in the bucket [gamma^(i-1), gamma^i), so any quantile is returned with at most
+# relative_accuracy error (1% by default) no matter how many values were added. Two sketches with the same
+# accuracy are merged by adding their bucket counts, which gives exactly the sketch of all values together,
+# so new listings can be folded in and ZIP codes can be combined into cities without keeping the listings.
+
+
+class QuantileSketch:
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {} # bucket index -> count
+        self.zeros = 0 # values <= 0 (e.g. a rent of 0), they have no bucket
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        positive = values[values > 0]
+        if len(positive):
+            indexes, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+            for i, c in zip(indexes.tolist(), counts.tolist()):
+                self.bins[i] = self.bins.get(i, 0) + c
+        self.zeros += len(values) - len(positive)
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for i, c in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + c
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def copy(self):
+        return QuantileSketch(self.relative_accuracy).merge(self)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else math.nan
+
+    # index-th smallest value (0 based) within the relative accuracy
+    def _value_at(self, index):
+        seen = self.zeros
+        if index < seen:
+            return min(self.min, 0.0)
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > index:
+                # middle of the bucket in the relative sense, clipped to the values that were really added
+                value = 2 * self.gamma ** i / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    # value at quantile q (0..1), e.g. 0.5 for the median
+    # interpolated between the two closest values like the default of numpy and pandas
+    def quantile(self, q):
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        low = math.floor(rank)
+        value = self._value_at(low)
+        if rank > low:
+            value += (self._value_at(low + 1) - value) * (rank - low)
+        return value
+
+    def quantiles(self, qs):
+        return [self.quantile(q) for q in qs]
@@ -0,0 +1,234 @@
+import argparse
+import json
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import joblib
+import pandas as pd
+
+from diagnostics import load_calibration
+from features import FEATURE_COLUMNS, apartment_feature_row
+from intervals import DEFAULT_LEVEL, LEVELS, predict_interval
+from market_stats import load_market_stats
+
+# Fair rent estimates over HTTP for other tools, without the Streamlit UI
+# The model is loaded once. Requests that arrive at the same time are collected into micro-batches and estimated
+# with one pass over all trees, which costs about as much as a single row, so the throughput grows with the load.
+#
+#   python scoring_service.py --port 8000
+#   curl -X POST localhost:8000/estimate -d '{"zip_code": 8001, "rooms": 3.5, "size": 80, "demanded_rent": 3000}'
+#
+# The same fields as the input page: zip_code (4 digits), rooms and size (both greater than 0) are required, outdoor_space ("No", "Balcony", ...),
+# is_renovated ("Yes"/"No"), parking ("No", "Parking Outdoor", "Garage") and demanded_rent are optional.
+# A list of apartments can be sent at once. GET /health returns the batching statistics.
+
+MODEL_FILE = "price_estimator.pkl"
+REQUIRED_FIELDS = ["zip_code", "rooms", "size"]
+POSITIVE_FIELDS = ["rooms", "size"]
+OPTIONAL_FIELDS = {"outdoor_space": "No", "is_renovated": "No", "parking": "No"}
+
+
+# Swiss ZIP codes have 4 digits, given as number or text
+def valid_zip(zip_code):
+    try:
+        value = float(zip_code)
+    except (TypeError, ValueError):
+        return False
+    return value.is_integer() and 1000 <= value <= 9999
+
+
+class MicroBatcher:
+
+    def __init__(self, predict, max_batch=64, max_wait_ms=2):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.rows = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stats(self):
+        return {"batches": self.batches, "rows": self.rows, "mean_batch_size": self.rows / self.batches if self.batches else 0}
+
+    # Future with the result of predict for one feature row (dict with the FEATURE_COLUMNS)
+    def submit(self, row):
+        future = Future()
+        self._queue.put((row, future))
+        return future
+
+    # waits for the first row, then at most max_wait for more rows, and predicts them all at once
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    items.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                predictions = self.predict(pd.DataFrame([row for row, _ in items])[FEATURE_COLUMNS])
+            except Exception:
+                # one bad row must not fail the other requests of the batch, every row gets its own result or error
+                for row, future in items:
+                    try:
+                        future.set_result(self.predict(pd.DataFrame([row])[FEATURE_COLUMNS])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+            else:
+                for (_, future), prediction in zip(items, predictions):
+                    future.set_result(prediction)
+            self.batches += 1
+            self.rows += len(items)
+
+
+class ScoringService:
+
+    def __init__(self, model_file=MODEL_FILE, max_batch=64, max_wait_ms=2, level=DEFAULT_LEVEL):
+        self.model = joblib.load(model_file)
+        self.calibration = load_calibration(self.model, model_file)
+        self.level = level
+        # price per m2 per year per ZIP code (median and percentiles), the same numbers as on the result page
+        self.market_prices = load_market_stats()
+        self.batcher = MicroBatcher(self.predict, max_batch, max_wait_ms)
+        self.started = time.time()
+
+    # (estimate, lower, upper) of every row, the calibrated price range of the trees (see intervals.py)
+    def predict(self, X):
+        return list(zip(*predict_interval(self.model, X, self.calibration, self.level)))
+
+    def stats(self):
+        return {"uptime_s": round(time.time() - self.started, 1), **self.batcher.stats()}
+
+    # estimate, price range and market comparison of a list of apartments
+    def estimate(self, apartments):
+        for apartment in apartments:
+            missing = [f for f in REQUIRED_FIELDS if apartment.get(f) in (None, "")]
+            if missing:
+                raise ValueError(f"missing fields: {', '.join(missing)}")
+            invalid = [f for f in POSITIVE_FIELDS if not (math.isfinite(float(apartment[f])) and float(apartment[f]) > 0)]
+            if invalid:
+                raise ValueError(f"must be a number greater than 0: {', '.join(invalid)}")
+            if not valid_zip(apartment["zip_code"]):
+                raise ValueError(f"not a 4 digit Swiss ZIP code: {apartment['zip_code']}")
+            if apartment.get("demanded_rent") is not None and not math.isfinite(float(apartment["demanded_rent"])):
+                raise ValueError("demanded_rent must be a number")
+
+        futures = []
+        for apartment in apartments:
+            options = {f: apartment.get(f, default) for f, default in OPTIONAL_FIELDS.items()}
+            futures.append(self.batcher.submit(apartment_feature_row(
+                apartment["zip_code"], float(apartment["rooms"]), float(apartment["size"]), **options)))
+        return [self.describe(apartment, future.result()) for apartment, future in zip(apartments, futures)]
+
+    def describe(self, apartment, prediction):
+        estimated, lower, upper = (float(value) for value in prediction)
+        size = float(apartment["size"])
+        result = {
+            "estimated_rent": round(estimated),
+            "lower_bound": int(lower),
+            "upper_bound": int(upper),
+            "range_level": self.level,
+            "market": None,
+        }
+
+        market = self.market_prices.get(int(float(apartment["zip_code"])))
+        if market is not None:
+            result["market"] = {
+                "listings": market["count"],
+                "median_price_m2_year": market["median"],
+                "p25_price_m2_year": market["p25"],
+                "p75_price_m2_year": market["p75"],
+                "estimated_price_m2_year": round(estimated / size * 12, 2),
+                "median_rent_for_size": round(market["median"] / 12 * size),
+            }
+
+        demanded = apartment.get("demanded_rent")
+        if demanded is not None:
+            demanded = float(demanded)
+            result["verdict"] = "overpriced" if demanded > result["upper_bound"] else \
+                "underpriced" if demanded < result["lower_bound"] else "fair"
+        return result
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, clients can reuse their connection
+    quiet = True
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok", **self.server.service.stats()})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/estimate":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+            apartments = body if isinstance(body, list) else [body]
+            if not all(isinstance(a, dict) for a in apartments):
+                raise ValueError("expected an apartment object or a list of them")
+            results = self.server.service.estimate(apartments)
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, results if isinstance(body, list) else results[0])
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128 # the default of 5 refuses connections when many clients connect at once
+
+
+def serve(host="127.0.0.1", port=8000, **service_options):
+    server = ScoringServer((host, port), ScoringHandler)
+    server.service = ScoringService(**service_options)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP service for fair rent estimates.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="port (default: 8000)")
+    parser.add_argument("--model", default=MODEL_FILE, help=f"model file (default: {MODEL_FILE})")
+    parser.add_argument("--max-batch", type=int, default=64, help="most apartments estimated in one predict call (default: 64)")
+    parser.add_argument("--max-wait-ms", type=float, default=2, help="how long a request waits for others to join its batch (default: 2)")
+    parser.add_argument("--level", type=float, default=DEFAULT_LEVEL, choices=LEVELS,
+                        help=f"share of the rents inside the price range (default: {DEFAULT_LEVEL})")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    ScoringHandler.quiet = not args.verbose
+    try:
+        server = serve(args.host, args.port, model_file=args.model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, level=args.level)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Scoring service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
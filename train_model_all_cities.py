@@ -1,100 +1,318 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
 import pandas as pd
 import joblib
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import KFold, train_test_split
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.metrics import mean_squared_error
+from ingestion import REQUIRED_COLUMNS, file_signature, load_listings
+from features import FEATURE_COLUMNS, KEYWORD_FEATURES, add_keyword_features
+from diagnostics import DIAGNOSTICS_FILE, build_diagnostics, load_diagnostics
+from intervals import MIN_CALIBRATION_ROWS, calibrate
+from compact_forest import COMPACT_DIR, compact_size, export_compact
+from comparables import COMPARABLES_FILE, build_comparables
+from model_router import SHARD_DIR, accuracy_report, shard_file, shard_key, write_manifest
 
 # Collect training data from .csv files
 # Add file names HERE to include them in the training model
 city_files = ["geneve.csv", "lausanne.csv", "st.gallen.csv", "zurich.csv"]
 
-# Load and merge the different datasets
-dfs = []
-for file in city_files:
-    df = pd.read_csv(file, encoding="latin1", sep=";")
-    df["source_file"] = file
-    dfs.append(df)
+MODEL_FILE = "price_estimator.pkl"
+TRAINING_CACHE_DIR = ".training_cache"
 
-data = pd.concat(dfs, ignore_index=True)
+# Hyperparameters tried by the search (--search), the number of trees is the budget that grows for the
+# candidates that survive each round
+SEARCH_SPACE = {
+    "max_depth": [None, 10, 15, 20, 30],
+    "min_samples_split": [2, 5, 10],
+    "min_samples_leaf": [1, 2, 3, 5],
+    "max_features": [1.0, 0.8, 0.6, 0.4, "sqrt"],
+}
 
-print("Loaded rows:", len(data))
-print("Columns:", data.columns)
-print(data.head())
 
-# Takes out the Zip Code 
-data[['ZIP', 'City']] = data['zip_city'].str.extract(r'(\d{4})\s*(.*)')
-data['ZIP'] = pd.to_numeric(data['ZIP'], errors='coerce')
+# all usable listings with their keyword features
+def prepare_listings(files=city_files, verbose=True):
+    # Load and merge the different datasets
+    # ingestion.py cleans the numerical columns (ZIP, rooms, square meters, rent) and caches the result,
+    # so only new or changed csv files are parsed again
+    data = load_listings(files)
 
-# Clean and convert numbers in the numerical columns
-# number_of_rooms; removes any room description besides the numerical value
-data['number_of_rooms'] = data['number_of_rooms'].str.extract(r'([\d\.]+)')
-data['number_of_rooms'] = pd.to_numeric(data['number_of_rooms'], errors='coerce')
+    if verbose:
+        print("Loaded rows:", len(data))
+        print("Columns:", data.columns)
+        print(data.head())
 
-# square_meters; takes just the numerical size
-data['square_meters'] = data['square_meters'].str.extract(r'(\d+)')
-data['square_meters'] = pd.to_numeric(data['square_meters'], errors='coerce')
+    # Checks if essential data (zip code, number of rooms, square meters, place type and rent)
+    # if something is missing, the row will be skipped
+    data = data.dropna(subset=REQUIRED_COLUMNS)
 
-# rent; only takes the price
-data['rent'] = data['rent'].str.replace(r'[^\d.]', '', regex=True)
-data['rent'] = pd.to_numeric(data['rent'], errors='coerce')
+    if verbose:
+        print("Remaining rows after cleaning:", len(data))
 
-# Checks if essential data (zip code, number of rooms, square meters, place type and rent)
-# if something is missing, the row will be skipped 
-required_columns = ['ZIP', 'number_of_rooms', 'square_meters', 'place_type', 'rent']
-data = data.dropna(subset=required_columns)
+    # Price influencing keyword detection in characteristics columns (outdoor space, renovated/new, parking)
+    # the keywords are defined in features.py
+    return add_keyword_features(data)
 
-print("Remaining rows after cleaning:", len(data))
 
-# Price influencing keyword detection in characteristics columns 
-def detect_feature(row, keywords):
-    values = [str(row['char.1']).lower(), str(row['char.2']).lower(), str(row['char.3']).lower()]
-    return int(any(any(k in v for k in keywords) for v in values))
+def load_training_data(files=city_files, verbose=True):
+    data = prepare_listings(files, verbose)
 
-# Outdoor spaces
-outdoor_keywords = ["terrace", "balcony", "garden", "patio", "loggia", "roof terrace", "outdoor"]
-data['Has_Outdoor_Space'] = data.apply(lambda row: detect_feature(row, outdoor_keywords), axis=1)
+    # Put the features on the X axis against the rent on the Y axis
+    return data[FEATURE_COLUMNS], data['rent']
 
-# Renovated/New
-modern_keywords = ["renovated", "new", "modern", "modern kitchen", "luxury"]
-data['Is_Renovated_or_New'] = data.apply(lambda row: detect_feature(row, modern_keywords), axis=1)
 
-# Parking space
-parking_keywords = ["parking", "garage"]
-data['Has_Parking'] = data.apply(lambda row: detect_feature(row, parking_keywords), axis=1)
+# changes whenever a csv file or the feature definition changes
+def training_cache_key(files=city_files):
+    sources = [(f, file_signature(f)) for f in files if os.path.exists(f)]
+    return hashlib.sha1(json.dumps([sources, FEATURE_COLUMNS, KEYWORD_FEATURES]).encode()).hexdigest()
 
-# Model Training
-# Put the features on the X axis against the rent on the Y axis to train a Random Forest Regressor model
-X = data[['ZIP', 'number_of_rooms', 'square_meters', 'place_type', 'Is_Renovated_or_New', 'Has_Parking', 'Has_Outdoor_Space']]
-y = data['rent']
 
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+# feature table and one hot encoded matrix of all listings, cached until a csv file changes
+# the matrix is memory-mapped, so the worker processes of the search read the same file instead of getting a copy
+def load_training_matrix(files=city_files, cache_dir=TRAINING_CACHE_DIR):
+    key = training_cache_key(files)
+    meta_file = os.path.join(cache_dir, "meta.json")
+    try:
+        with open(meta_file) as f:
+            cached = json.load(f)["key"] == key
+    except (OSError, ValueError, KeyError):
+        cached = False
 
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('cat', OneHotEncoder(handle_unknown='ignore'), ['place_type'])
-    ],
-    remainder='passthrough'
-)
+    if not cached:
+        X, y = load_training_data(files, verbose=False)
+        preprocessor = build_pipeline().named_steps['preprocessor'].fit(X)
+        os.makedirs(cache_dir, exist_ok=True)
+        X.assign(rent=y).reset_index(drop=True).to_parquet(os.path.join(cache_dir, "features.parquet"), index=False)
+        np.save(os.path.join(cache_dir, "X.npy"), np.asarray(preprocessor.transform(X), dtype=np.float32))
+        joblib.dump(preprocessor, os.path.join(cache_dir, "preprocessor.pkl"))
+        # written last, a cache that was interrupted while writing is never used
+        with open(meta_file, "w") as f:
+            json.dump({"key": key, "rows": len(X)}, f, indent=2)
 
-model_pipeline = Pipeline(steps=[
-    ('preprocessor', preprocessor),
-    ('regressor', RandomForestRegressor(n_estimators=100, random_state=42))
-])
+    features = pd.read_parquet(os.path.join(cache_dir, "features.parquet"))
+    X_encoded = np.load(os.path.join(cache_dir, "X.npy"), mmap_mode="r")
+    preprocessor = joblib.load(os.path.join(cache_dir, "preprocessor.pkl"))
+    return features[FEATURE_COLUMNS], features['rent'], X_encoded, preprocessor
 
-model_pipeline.fit(X_train, y_train)
 
-y_pred = model_pipeline.predict(X_test)
-rmse = mean_squared_error(y_test, y_pred, squared=False)
-print(f"Unified Model trained. RMSE: CHF {rmse:,.2f}")
+# Random Forest Regressor model with one hot encoding of the place type
+def build_pipeline(**regressor_params):
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('cat', OneHotEncoder(handle_unknown='ignore'), ['place_type'])
+        ],
+        remainder='passthrough'
+    )
 
-# model for the price estiomation
-joblib.dump(model_pipeline, "price_estimator.pkl")
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('regressor', RandomForestRegressor(**{"n_estimators": 100, "random_state": 42, **regressor_params}))
+    ])
 
-# Data required for the diagram
-joblib.dump((X_test, y_test, y), "model_diagnostics.pkl")
 
-print("Model saved as 'price_estimator.pkl'")
-print("Diagnostics saved as 'model_diagnostics.pkl'")
\ No newline at end of file
+def split(*arrays):
+    return train_test_split(*arrays, test_size=0.2, random_state=42)
+
+
+# One model per ZIP region (--shards), trained on the training listings of the region. The app only uses a shard
+# when it is at least as accurate as the unified model on the test listings of its region (see model_router.py).
+# The price ranges of a shard are calibrated on the same test listings, small regions use the unified ones.
+def train_shards(X_train, y_train, X_test, y_test, unified, names=None, min_rows=100, shard_dir=SHARD_DIR):
+    os.makedirs(shard_dir, exist_ok=True)
+    for old in os.listdir(shard_dir):
+        if old.startswith("shard_"):
+            os.remove(os.path.join(shard_dir, old))
+
+    train_keys = X_train['ZIP'].map(shard_key).to_numpy()
+    test_keys = X_test['ZIP'].map(shard_key).to_numpy()
+    manifest = {}
+    for key in sorted(set(train_keys)):
+        train_rows, test_rows = train_keys == key, test_keys == key
+        entry = {
+            "name": (names or {}).get(key, f"{key:02d}xx"),
+            "file": shard_file(key),
+            "train_rows": int(train_rows.sum()),
+            "test_rows": int(test_rows.sum()),
+            "rmse": None,
+            "unified_rmse": None,
+            "size_mb": 0.0,
+            "routed": False,
+            "intervals": None,
+        }
+        if entry["train_rows"] >= min_rows:
+            shard = for_prediction(build_pipeline(n_jobs=-1).fit(X_train[train_rows], y_train[train_rows]))
+            if test_rows.any():
+                entry["rmse"] = float(mean_squared_error(y_test[test_rows], shard.predict(X_test[test_rows]), squared=False))
+                entry["unified_rmse"] = float(mean_squared_error(y_test[test_rows], unified.predict(X_test[test_rows]), squared=False))
+                entry["routed"] = entry["rmse"] <= entry["unified_rmse"]
+            # the trees of a shard disagree differently than the unified ones, so it gets its own price ranges
+            if entry["test_rows"] >= MIN_CALIBRATION_ROWS:
+                entry["intervals"] = shard.calibration = calibrate(shard, X_test[test_rows], y_test[test_rows])
+            joblib.dump(shard, os.path.join(shard_dir, entry["file"]))
+            entry["size_mb"] = os.path.getsize(os.path.join(shard_dir, entry["file"])) / 1e6
+        manifest[key] = entry
+    write_manifest(manifest, shard_dir)
+    return manifest
+
+
+# the trees are trained on all cores, but the saved model predicts on one core:
+# the app predicts single rows and batch_score.py already runs one process per core
+def for_prediction(pipeline):
+    pipeline.named_steps['regressor'].set_params(n_jobs=None, warm_start=False)
+    return pipeline
+
+
+# Cross-validated successive halving: all candidates start with a few trees, only the best third of every round
+# gets three times as many trees, so bad candidates are stopped early. The candidate fits of every round run
+# in a process pool on all cores. Returns the best parameters (incl. n_estimators) and the search.
+def search_hyperparameters(X_encoded, y, train_idx, max_trees=300, cv=5, verbose=0):
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingRandomSearchCV
+
+    # folds over the training rows only, given as positions in the full memory-mapped matrix
+    folds = [(train_idx[a], train_idx[b]) for a, b in KFold(cv, shuffle=True, random_state=42).split(train_idx)]
+    search = HalvingRandomSearchCV(
+        RandomForestRegressor(random_state=42),
+        SEARCH_SPACE,
+        resource="n_estimators",
+        min_resources=max(max_trees // 27, 5),
+        max_resources=max_trees,
+        factor=3,
+        cv=folds,
+        scoring="neg_root_mean_squared_error",
+        refit=False,
+        n_jobs=-1,
+        random_state=42,
+        verbose=verbose,
+    )
+    search.fit(X_encoded, np.asarray(y, dtype=np.float64))
+    return search.best_params_, search
+
+
+# --add-trees keeps the test listings of the saved model (from its diagnostics): a new split of the current
+# listings would test on listings the old trees were trained on. Every other listing, incl. the new ones, is for training.
+def held_out_split(X, y, X_test, y_test):
+    def keys(X, y):
+        frame = X.assign(rent=y)
+        return pd.MultiIndex.from_frame(frame.apply(lambda c: c.astype(float) if pd.api.types.is_numeric_dtype(c) else c.astype(str)))
+
+    test_rows = keys(X, y).isin(keys(X_test, y_test))
+    return X[~test_rows], X_test[FEATURE_COLUMNS], y[~test_rows], y_test
+
+
+# warm start: the trees of the saved model are kept and n new trees are trained on the current listings
+# the saved preprocessor is reused, so the columns stay the same for the old and the new trees
+def add_trees(pipeline, X_train, y_train, n):
+    regressor = pipeline.named_steps['regressor']
+    regressor.set_params(warm_start=True, n_estimators=len(regressor.estimators_) + n, n_jobs=-1)
+    regressor.fit(pipeline.named_steps['preprocessor'].transform(X_train), y_train)
+    return pipeline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the price estimator on all city csv files.")
+    parser.add_argument("--search", action="store_true", help="cross-validated hyperparameter search on all cores before training")
+    parser.add_argument("--search-max-trees", type=int, default=300, help="trees of the candidates in the last search round (default: 300)")
+    parser.add_argument("--search-cv", type=int, default=5, help="cross-validation folds of the search (default: 5)")
+    parser.add_argument("--add-trees", type=int, default=None, help=f"keep the trees of '{MODEL_FILE}' and only train this many new ones")
+    parser.add_argument("--shards", action="store_true", help=f"also train one model per ZIP region into '{SHARD_DIR}'")
+    parser.add_argument("--shard-min-rows", type=int, default=100, help="regions with fewer training listings use the unified model (default: 100)")
+    parser.add_argument("--compact", action="store_true", help=f"also export a compact, memory-mapped model to '{COMPACT_DIR}'")
+    parser.add_argument("--compact-trees", type=int, default=None, help="number of trees of the compact model (default: same model)")
+    parser.add_argument("--compact-max-depth", type=int, default=None, help="depth limit of the compact model's trees")
+    parser.add_argument("--compact-min-samples-leaf", type=int, default=None, help="minimum listings per leaf of the compact model")
+    args = parser.parse_args()
+    if args.add_trees and args.search:
+        parser.error("--add-trees keeps the settings of the saved model and can't be combined with --search")
+
+    start = time.perf_counter()
+
+    # Model Training
+    if args.search or args.add_trees:
+        # cached features and encoded matrix, only rebuilt when a csv file changed
+        X, y, X_encoded, preprocessor = load_training_matrix()
+        train_idx, test_idx = split(np.arange(len(y)))
+        X_train, X_test, y_train, y_test = X.iloc[train_idx], X.iloc[test_idx], y.iloc[train_idx], y.iloc[test_idx]
+        print(f"Training data ready: {len(y)} rows ({time.perf_counter() - start:.1f} s)")
+    else:
+        X, y = load_training_data()
+        X_train, X_test, y_train, y_test = split(X, y)
+
+    if args.add_trees:
+        model_pipeline = joblib.load(MODEL_FILE)
+        saved = load_diagnostics(model_pipeline)
+        X_train, X_test, y_train, y_test = held_out_split(X, y, saved["X_test"], saved["y_test"])
+        model_pipeline = add_trees(model_pipeline, X_train, y_train, args.add_trees)
+        print(f"Added {args.add_trees} trees, the model has {len(model_pipeline.named_steps['regressor'].estimators_)} trees now")
+    elif args.search:
+        best_params, search = search_hyperparameters(X_encoded, y, train_idx, args.search_max_trees, args.search_cv)
+        print(f"Best parameters: {best_params} (CV RMSE: CHF {-search.best_score_:,.2f}, "
+              f"{len(search.cv_results_['params'])} candidate evaluations in {search.n_iterations_} rounds)")
+        regressor = RandomForestRegressor(**{"random_state": 42, **best_params, "n_jobs": -1})
+        regressor.fit(X_encoded[train_idx], y_train)
+        model_pipeline = Pipeline(steps=[('preprocessor', preprocessor), ('regressor', regressor)])
+    else:
+        model_pipeline = build_pipeline(n_jobs=-1)
+        model_pipeline.fit(X_train, y_train)
+
+    model_pipeline = for_prediction(model_pipeline)
+    y_pred = model_pipeline.predict(X_test)
+    rmse = mean_squared_error(y_test, y_pred, squared=False)
+    print(f"Unified Model trained in {time.perf_counter() - start:.1f} s. RMSE: CHF {rmse:,.2f}")
+
+    # calibration of the price ranges on the test set, saved with the model and in the diagnostics
+    calibration = calibrate(model_pipeline, X_test, y_test)
+    model_pipeline.calibration = calibration
+
+    # model for the price estiomation
+    joblib.dump(model_pipeline, MODEL_FILE)
+    # the app prefers the compact model, an old one would be used instead of this model (exported again with --compact)
+    if not args.compact:
+        shutil.rmtree(COMPACT_DIR, ignore_errors=True)
+    # same for the shards, they were only routed because they beat the old unified model (trained again with --shards)
+    if not args.shards:
+        shutil.rmtree(SHARD_DIR, ignore_errors=True)
+
+    # Data required for the diagram, incl. the predictions of the test set so the app doesn't need to compute them
+    joblib.dump(build_diagnostics(X_test, y_test, y, y_pred, calibration), DIAGNOSTICS_FILE)
+
+    # Similar real listings for the result page, searched in a prebuilt index instead of per request
+    listings = prepare_listings(verbose=False)
+    comparables = build_comparables(listings)
+
+    print(f"Model saved as '{MODEL_FILE}'")
+    print(f"Diagnostics saved as '{DIAGNOSTICS_FILE}'")
+    print("Price ranges: " + ", ".join(f"{level:.0%} range = estimate ± {factor:.2f} x tree spread"
+                                       for level, factor in calibration["levels"].items()))
+    print(f"Comparable listings index saved as '{COMPARABLES_FILE}' ({len(comparables)} listings)")
+
+    # Models per ZIP region, named after the most frequent city of the region
+    if args.shards:
+        names = listings.groupby(listings['ZIP'].map(shard_key))['City'].agg(lambda c: c.mode().iloc[0]).to_dict()
+        train_shards(X_train, y_train, X_test, y_test, model_pipeline, names, args.shard_min_rows)
+        print(f"Shards saved to '{SHARD_DIR}'")
+        print(accuracy_report())
+
+    # Compact model for the app, smaller trees can be traded for accuracy (see benchmarks/bench_compact_model.py)
+    if args.compact:
+        compact_params = {
+            "n_estimators": args.compact_trees,
+            "max_depth": args.compact_max_depth,
+            "min_samples_leaf": args.compact_min_samples_leaf,
+        }
+        compact_params = {k: v for k, v in compact_params.items() if v is not None}
+        compact_pipeline = model_pipeline
+        if compact_params:
+            compact_pipeline = for_prediction(build_pipeline(**compact_params, n_jobs=-1).fit(X_train, y_train))
+            compact_rmse = mean_squared_error(y_test, compact_pipeline.predict(X_test), squared=False)
+            print(f"Compact Model trained {compact_params}. RMSE: CHF {compact_rmse:,.2f}")
+        export_compact(compact_pipeline, calibration=calibrate(compact_pipeline, X_test, y_test))
+        print(f"Compact model saved to '{COMPACT_DIR}' ({compact_size() / 1e6:.1f} MB)")